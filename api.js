@@ -50,6 +50,12 @@ class APIClient {
           window.location.href = "index.html"
           throw new Error("Unauthorized")
         }
+        // Shed by admission control: retry an idempotent read once after Retry-After
+        if (response.status === 503 && config.method === "GET" && !options.retried) {
+          const delay = Number(response.headers.get("Retry-After") || 1) * 1000
+          await new Promise((resolve) => setTimeout(resolve, delay))
+          return this.request(endpoint, { ...options, retried: true })
+        }
         throw new Error(`HTTP error! status: ${response.status}`)
       }
 
@@ -167,6 +173,44 @@ class APIClient {
     return this.delete(`/courses/${courseId}`)
   }
 
+  async enrollInCourse(courseId, studentId = null) {
+    const query = studentId ? `?student_id=${studentId}` : ""
+    return this.post(`/courses/${courseId}/enroll${query}`)
+  }
+
+  async unenrollFromCourse(courseId, studentId = null) {
+    const query = studentId ? `?student_id=${studentId}` : ""
+    return this.delete(`/courses/${courseId}/enroll${query}`)
+  }
+
+  async getCourseStudents(courseId, skip = 0, limit = 100) {
+    return this.get(`/courses/${courseId}/students?skip=${skip}&limit=${limit}`)
+  }
+
+  async getCourseAnalytics(courseId) {
+    return this.get(`/courses/${courseId}/analytics`)
+  }
+
+  async getCourseLeaderboard(courseId, metric = "average_score", skip = 0, limit = 10) {
+    return this.get(`/courses/${courseId}/leaderboard?metric=${metric}&skip=${skip}&limit=${limit}`)
+  }
+
+  async getMyCourseRank(courseId, metric = "average_score") {
+    return this.get(`/courses/${courseId}/leaderboard/me?metric=${metric}`)
+  }
+
+  async getRecommendedCourses(limit = 10) {
+    return this.get(`/recommendations?limit=${limit}`)
+  }
+
+  async getStudentRecommendations(studentId, limit = 10) {
+    return this.get(`/students/${studentId}/recommendations?limit=${limit}`)
+  }
+
+  async getStudentCourses(studentId) {
+    return this.get(`/students/${studentId}/courses`)
+  }
+
   // Assignment APIs
   async getAssignments(skip = 0, limit = 100) {
     return this.get(`/assignments?skip=${skip}&limit=${limit}`)
@@ -188,6 +232,27 @@ class APIClient {
     return this.delete(`/assignments/${assignmentId}`)
   }
 
+  async submitAssignment(assignmentId, file, content = "") {
+    if (file) {
+      return this.uploadFile(`/assignments/${assignmentId}/submissions`, file, { content })
+    }
+    const formData = new FormData()
+    formData.append("content", content)
+    return this.request(`/assignments/${assignmentId}/submissions`, {
+      method: "POST",
+      headers: this.token ? { Authorization: `Bearer ${this.token}` } : {},
+      body: formData,
+    })
+  }
+
+  async getSubmissions(assignmentId, skip = 0, limit = 100) {
+    return this.get(`/assignments/${assignmentId}/submissions?skip=${skip}&limit=${limit}`)
+  }
+
+  async gradeSubmission(submissionId, gradeData) {
+    return this.post(`/submissions/${submissionId}/grade`, gradeData)
+  }
+
   // Exam APIs
   async getExams(skip = 0, limit = 100) {
     return this.get(`/exams?skip=${skip}&limit=${limit}`)
@@ -209,6 +274,30 @@ class APIClient {
     return this.delete(`/exams/${examId}`)
   }
 
+  async startExam(examId) {
+    return this.post(`/exams/${examId}/start`)
+  }
+
+  async getExamSession(sessionId) {
+    return this.get(`/exam-sessions/${sessionId}`)
+  }
+
+  async saveExamAnswers(sessionId, answers) {
+    return this.put(`/exam-sessions/${sessionId}/answers`, { answers })
+  }
+
+  async submitExam(sessionId) {
+    return this.post(`/exam-sessions/${sessionId}/submit`)
+  }
+
+  async setExamAnswerKey(examId, answerKey) {
+    return this.put(`/exams/${examId}/answer-key`, answerKey)
+  }
+
+  async gradeExam(examId) {
+    return this.post(`/exams/${examId}/grade`)
+  }
+
   // Webinar APIs
   async getWebinars(skip = 0, limit = 100) {
     return this.get(`/webinars?skip=${skip}&limit=${limit}`)
@@ -230,6 +319,22 @@ class APIClient {
     return this.delete(`/webinars/${webinarId}`)
   }
 
+  async registerForWebinar(webinarId) {
+    return this.post(`/webinars/${webinarId}/register`)
+  }
+
+  async unregisterFromWebinar(webinarId) {
+    return this.delete(`/webinars/${webinarId}/register`)
+  }
+
+  async getWebinarRegistrations(webinarId, status = null) {
+    let url = `/webinars/${webinarId}/registrations`
+    if (status) {
+      url += `?status=${status}`
+    }
+    return this.get(url)
+  }
+
   // Student APIs
   async getStudents(skip = 0, limit = 100) {
     return this.get(`/students?skip=${skip}&limit=${limit}`)
@@ -281,11 +386,14 @@ class APIClient {
   }
 
   // Forum APIs
-  async getForumTopics(skip = 0, limit = 100, category = null) {
+  async getForumTopics(skip = 0, limit = 100, category = null, sort = null) {
     let url = `/forum?skip=${skip}&limit=${limit}`
     if (category) {
       url += `&category=${category}`
     }
+    if (sort) {
+      url += `&sort=${sort}`
+    }
     return this.get(url)
   }
 
@@ -305,6 +413,40 @@ class APIClient {
     return this.delete(`/forum/${topicId}`)
   }
 
+  async getForumReplies(topicId, before = null, limit = 20) {
+    let url = `/forum/${topicId}/replies?limit=${limit}`
+    if (before) {
+      url += `&before=${encodeURIComponent(before)}`
+    }
+    return this.get(url)
+  }
+
+  async createForumReply(topicId, replyData) {
+    return this.post(`/forum/${topicId}/replies`, replyData)
+  }
+
+  // Analytics APIs
+  async getActivityAnalytics(type, from, to, granularity = "day") {
+    const range = `from=${encodeURIComponent(from)}&to=${encodeURIComponent(to)}`
+    return this.get(`/analytics/activity?type=${type}&${range}&granularity=${granularity}`)
+  }
+
+  // Calendar APIs
+  async getCalendar(from, to, skip = 0, limit = 100) {
+    const range = `from=${encodeURIComponent(from)}&to=${encodeURIComponent(to)}`
+    return this.get(`/calendar?${range}&skip=${skip}&limit=${limit}`)
+  }
+
+  // Autocomplete APIs
+  async autocomplete(query, type = "courses", limit = 10) {
+    return this.get(`/autocomplete?q=${encodeURIComponent(query)}&type=${type}&limit=${limit}`)
+  }
+
+  // Search APIs
+  async globalSearch(query, limit = 20) {
+    return this.get(`/search/global?q=${encodeURIComponent(query)}&limit=${limit}`)
+  }
+
   // Notification APIs
   async getNotifications() {
     return this.get("/notifications")
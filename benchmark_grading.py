@@ -0,0 +1,96 @@
+"""
+Batch Grading Benchmark for EduTeach API
+Scores a synthetic cohort with the vectorized grader and a per-submission loop
+"""
+
+import time
+import random
+from main import response_row, score_exam_batch
+
+# Configuration
+SUBMISSIONS = 10000
+QUESTIONS = 100
+NUMERIC_QUESTIONS = 20
+CHOICES = ["A", "B", "C", "D"]
+
+def build_cohort():
+    """Build an answer key and random responses (roughly 70% correct)"""
+    random.seed(42)
+    types = ["choice"] * (QUESTIONS - NUMERIC_QUESTIONS) + ["numeric"] * NUMERIC_QUESTIONS
+    answers = [
+        random.choice(CHOICES) if t == "choice" else str(round(random.uniform(0, 100), 2))
+        for t in types
+    ]
+    key = {
+        "answers": answers,
+        "types": types,
+        "points": [1.0] * QUESTIONS,
+        "tolerance": [0.01] * QUESTIONS,
+        "max_score": 100
+    }
+    
+    responses = []
+    for _ in range(SUBMISSIONS):
+        response = {}
+        for i, (answer, question_type) in enumerate(zip(answers, types)):
+            roll = random.random()
+            if roll < 0.05:
+                continue  # left blank
+            if roll < 0.75:
+                response[str(i)] = answer
+            elif question_type == "choice":
+                response[str(i)] = random.choice(CHOICES)
+            else:
+                response[str(i)] = str(round(random.uniform(0, 100), 2))
+        responses.append(response)
+    return key, responses
+
+def score_loop(key, responses):
+    """Reference implementation: one submission and one question at a time"""
+    total_points = sum(key["points"])
+    scores = []
+    for response in responses:
+        earned = 0.0
+        for i, answer in enumerate(key["answers"]):
+            given = response.get(str(i), "").strip().upper()
+            if key["types"][i] == "numeric":
+                try:
+                    ok = abs(float(given) - float(answer)) <= key["tolerance"][i]
+                except ValueError:
+                    ok = False
+            else:
+                ok = given == answer.strip().upper()
+            if ok:
+                earned += key["points"][i]
+        scores.append(earned / total_points * key["max_score"])
+    return scores
+
+def main():
+    print(f"📝 Building cohort: {SUBMISSIONS} submissions × {QUESTIONS} questions...")
+    key, responses = build_cohort()
+    
+    start = time.perf_counter()
+    expected = score_loop(key, responses)
+    loop_seconds = time.perf_counter() - start
+    
+    # The grade endpoint flattens rows while the Mongo cursor streams
+    start = time.perf_counter()
+    rows = [response_row(response, QUESTIONS) for response in responses]
+    flatten_seconds = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    scores, _, question_stats = score_exam_batch(key, rows)
+    batch_seconds = time.perf_counter() - start
+    
+    mismatches = sum(abs(a - b) > 1e-9 for a, b in zip(expected, scores))
+    print("=" * 50)
+    print(f"⏱️  Per-submission loop (scores only): {loop_seconds:.3f}s")
+    print(f"📥 Flattening answers to rows: {flatten_seconds:.3f}s")
+    print(f"⚡ Vectorized batch (scores + stats): {batch_seconds:.3f}s")
+    print(f"🚀 Speedup (flatten + batch): {loop_seconds / (flatten_seconds + batch_seconds):.1f}x")
+    print(f"✅ Score mismatches: {mismatches}")
+    print(f"📊 Mean difficulty: {sum(q['difficulty'] for q in question_stats) / QUESTIONS:.3f}")
+    print("=" * 50)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Throughput Benchmark for EduTeach API
+Starts server.py with 1, 2, 4... workers against a running MongoDB and
+measures requests/second on a read endpoint to show scaling across cores
+"""
+
+import os
+import sys
+import time
+import signal
+import asyncio
+import subprocess
+import aiohttp
+
+# Configuration
+PORT = 8100
+API_URL = f"http://127.0.0.1:{PORT}"
+ENDPOINT = "/courses"
+WORKER_COUNTS = [n for n in (1, 2, 4, 8, 16) if n <= (os.cpu_count() or 1)]
+CONCURRENCY = 64
+DURATION_SECONDS = 10
+STARTUP_TIMEOUT_SECONDS = 30
+
+def start_server(workers):
+    env = {**os.environ, "PORT": str(PORT), "WEB_CONCURRENCY": str(workers), "MAX_REQUESTS": "0"}
+    return subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+async def wait_until_ready(session):
+    deadline = time.monotonic() + STARTUP_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        try:
+            async with session.get(f"{API_URL}/health") as response:
+                if response.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.5)
+    raise RuntimeError("Server did not become ready")
+
+async def login(session):
+    async with session.post(f"{API_URL}/token", data={"username": "admin@example.com", "password": "admin123"}) as response:
+        response.raise_for_status()
+        return {"Authorization": f"Bearer {(await response.json())['access_token']}"}
+
+async def client_loop(session, headers, deadline, latencies, errors):
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        try:
+            async with session.get(f"{API_URL}{ENDPOINT}", headers=headers) as response:
+                await response.read()
+                if response.status != 200:
+                    errors.append(response.status)
+                    continue
+        except aiohttp.ClientError as e:
+            errors.append(type(e).__name__)
+            continue
+        latencies.append(time.perf_counter() - start)
+
+async def measure(workers):
+    process = start_server(workers)
+    try:
+        connector = aiohttp.TCPConnector(limit=CONCURRENCY)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            await wait_until_ready(session)
+            headers = await login(session)
+            latencies, errors = [], []
+            deadline = time.monotonic() + DURATION_SECONDS
+            await asyncio.gather(*[
+                client_loop(session, headers, deadline, latencies, errors) for _ in range(CONCURRENCY)
+            ])
+    finally:
+        # SIGTERM exercises the graceful drain path
+        process.send_signal(signal.SIGTERM)
+        process.wait(60)
+
+    latencies.sort()
+    def percentile(p):
+        return latencies[int(p * (len(latencies) - 1))] * 1000 if latencies else 0.0
+    return {
+        "workers": workers,
+        "rps": len(latencies) / DURATION_SECONDS,
+        "p50": percentile(0.50),
+        "p99": percentile(0.99),
+        "errors": len(errors)
+    }
+
+async def main():
+    print(f"🏁 GET {ENDPOINT} with {CONCURRENCY} concurrent clients for {DURATION_SECONDS}s per run")
+    results = []
+    for workers in WORKER_COUNTS:
+        print(f"⏳ Running with {workers} worker(s)...")
+        results.append(await measure(workers))
+
+    baseline = results[0]["rps"] or 1
+    print("=" * 60)
+    print(f"{'workers':>8} {'req/s':>10} {'scaling':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for r in results:
+        print(f"{r['workers']:>8} {r['rps']:>10.0f} {r['rps'] / baseline:>7.1f}x {r['p50']:>8.1f} {r['p99']:>8.1f} {r['errors']:>7}")
+    print("=" * 60)
+
+if __name__ == "__main__":
+    asyncio.run(main())
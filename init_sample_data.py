@@ -514,6 +514,11 @@ class SampleDataGenerator:
             }
         ]
         
+        # Running sums behind completed_assignments/average_score
+        for student in students_data:
+            student["score_sum"] = student["average_score"] * student["completed_assignments"]
+            student["graded_count"] = student["completed_assignments"]
+        
         result = await self.database.students.insert_many(students_data)
         
         # Store students for reference
@@ -732,6 +737,16 @@ class SampleDataGenerator:
         
         print(f"✅ Created {len(forum_data)} forum topics!")
 
+    async def bump_collection_versions(self):
+        """Bump collection versions so running API workers drop caches and ETags"""
+        collections = ['users', 'courses', 'assignments', 'exams', 'webinars', 
+                      'students', 'library', 'forum']
+        
+        for collection in collections:
+            await self.database.collection_versions.update_one(
+                {"_id": collection}, {"$inc": {"version": 1}}, upsert=True
+            )
+
     async def generate_all_data(self, clear_existing=True):
         """Generate all sample data"""
         print("🚀 Starting sample data generation...")
@@ -749,6 +764,7 @@ class SampleDataGenerator:
         await self.create_students()
         await self.create_library_documents()
         await self.create_forum_topics()
+        await self.bump_collection_versions()
         
         print("=" * 50)
         print("🎉 Sample data generation completed!")
@@ -0,0 +1,92 @@
+"""
+Webinar Registration Load Test for EduTeach API
+Fires hundreds of concurrent registrations at one webinar and checks that
+seats are never oversold and the overflow lands on the waitlist
+
+All signups come from one IP, so start the server with RATE_LIMIT_ENABLED=false
+in its environment
+"""
+
+import asyncio
+import time
+import uuid
+from datetime import datetime, timedelta
+import aiohttp
+
+# Configuration
+API_URL = "http://localhost:8000"
+USERS = 300
+CAPACITY = 50
+SIGNUP_CONCURRENCY = 20
+
+async def login(session, email, password):
+    async with session.post(f"{API_URL}/token", data={"username": email, "password": password}) as response:
+        response.raise_for_status()
+        data = await response.json()
+        return {"Authorization": f"Bearer {data['access_token']}"}
+
+async def create_user(session, semaphore, run_id, index):
+    email = f"loadtest-{run_id}-{index}@example.com"
+    async with semaphore:
+        async with session.post(f"{API_URL}/register", json={
+            "email": email,
+            "full_name": f"Load Test {index}",
+            "password": "loadtest123"
+        }) as response:
+            response.raise_for_status()
+        return await login(session, email, "loadtest123")
+
+async def register(session, webinar_id, headers):
+    async with session.post(f"{API_URL}/webinars/{webinar_id}/register", headers=headers) as response:
+        if response.status != 200:
+            return f"http {response.status}"
+        return (await response.json())["status"]
+
+async def main():
+    run_id = uuid.uuid4().hex[:8]
+    async with aiohttp.ClientSession() as session:
+        print("🔑 Logging in as teacher...")
+        teacher = await login(session, "teacher@example.com", "teacher123")
+        
+        async with session.post(f"{API_URL}/webinars", headers=teacher, json={
+            "title": f"Load test webinar {run_id}",
+            "scheduled_date": (datetime.utcnow() + timedelta(days=1)).isoformat(),
+            "duration_minutes": 60,
+            "max_participants": CAPACITY
+        }) as response:
+            response.raise_for_status()
+            webinar_id = (await response.json())["id"]
+        
+        print(f"👥 Creating {USERS} users...")
+        semaphore = asyncio.Semaphore(SIGNUP_CONCURRENCY)
+        users = await asyncio.gather(*[create_user(session, semaphore, run_id, i) for i in range(USERS)])
+        
+        print(f"🚀 Sending {USERS} concurrent registrations for {CAPACITY} seats...")
+        start = time.perf_counter()
+        results = await asyncio.gather(*[register(session, webinar_id, headers) for headers in users])
+        elapsed = time.perf_counter() - start
+        
+        async with session.get(f"{API_URL}/webinars/{webinar_id}/registrations?limit={USERS}", headers=teacher) as response:
+            registrations = await response.json()
+        async with session.get(f"{API_URL}/webinars/{webinar_id}", headers=teacher) as response:
+            webinar = await response.json()
+    
+    registered = results.count("registered")
+    waitlisted = results.count("waitlisted")
+    stored_registered = sum(1 for r in registrations if r["status"] == "registered")
+    
+    print("=" * 50)
+    print(f"⏱️  {USERS} registrations in {elapsed:.2f}s ({USERS / elapsed:.0f} req/s)")
+    print(f"✅ Registered: {registered} (stored: {stored_registered}, registered_count: {webinar['registered_count']})")
+    print(f"⏳ Waitlisted: {waitlisted}")
+    print(f"❌ Errors: {USERS - registered - waitlisted}")
+    
+    ok = (
+        registered == stored_registered == webinar["registered_count"] == min(USERS, CAPACITY)
+        and waitlisted == USERS - registered
+    )
+    print("🎉 Counts are consistent" if ok else "💥 Counts are INCONSISTENT")
+    print("=" * 50)
+
+if __name__ == "__main__":
+    asyncio.run(main())
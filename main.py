@@ -1,31 +1,203 @@
-from fastapi import FastAPI, HTTPException, Depends, status, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, Depends, status, UploadFile, File, Form, Request, Response, Query
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel, EmailStr
-from typing import Optional, List
-from datetime import datetime, timedelta
+from typing import Optional, List, Dict
+from datetime import datetime, timedelta, timezone
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 import motor.motor_asyncio
-from bson import ObjectId
+from bson import ObjectId, Binary
+from pymongo import ReturnDocument, UpdateOne, monitoring
+from pymongo.read_preferences import SecondaryPreferred
+from pymongo.errors import PyMongoError, DuplicateKeyError, ExecutionTimeout, BulkWriteError
 import os
 from pathlib import Path
 import shutil
 import uuid
+import hashlib
+import zlib
+import bisect
+import unicodedata
+import time
+import asyncio
+import random
+import heapq
+import math
+import socket
+import re
+import json
+import logging
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from itertools import islice
+import numpy as np
+from sortedcontainers import SortedList
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+logger = logging.getLogger(__name__)
 
 # Configuration
 SECRET_KEY = "your-secret-key-here"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+DOCUMENT_CACHE_SIZE = 1000
+DOCUMENT_CACHE_TTL_SECONDS = 60
+INVALIDATION_POLL_SECONDS = 2
+INVALIDATION_CHANGE_LOG_SIZE = 100  # recent doc ids kept per collection for the poller
+COMPRESSION_MINIMUM_SIZE = 1024
+COMPRESSION_CACHE_SIZE = 256
+COMPRESSION_CACHE_MAX_BODY = 1024 * 1024
+ANSWER_FLUSH_SECONDS = 1.0
+ANSWER_FLUSH_MAX_PENDING = 5000
+EXAM_SUBMIT_GRACE_SECONDS = 30
+EXAM_MAX_QUESTIONS = 500  # autosave bound for exams created without total_questions
+ENROLLMENT_COUNTER_SHARDS = 16
+SCHEDULER_HORIZON_SECONDS = 300
+SCHEDULER_LEASE_SECONDS = 30
+SCHEDULER_RELOAD_DEBOUNCE_SECONDS = 1  # min gap between edit-triggered reloads
+HOT_SCORE_FLUSH_SECONDS = 30
+HOT_SCORE_HALF_LIFE_HOURS = 12
+HOT_SCORE_EPOCH = datetime(2024, 1, 1)
+HLL_PRECISION = 12  # 4096 one-byte registers, ~1.6% standard error
+SKETCH_PROJECTION = {"viewer_hll": 0}  # keep 4 KB sketches out of API reads
+VIEWER_SKETCH_FLUSH_SECONDS = 30
+ACTIVITY_FLUSH_SECONDS = 10
+ACTIVITY_EVENT_RETENTION_DAYS = 30
+HOURLY_ROLLUP_RETENTION_DAYS = 14
+COURSE_ANALYTICS_TTL_SECONDS = 300
+AT_RISK_PROGRESS = 40
+AT_RISK_SCORE = 5.0
+LEADERBOARD_RELOAD_DEBOUNCE_SECONDS = 5
+RECOMMENDATION_REBUILD_SECONDS = 600
+RECOMMENDATION_TOP_K = 20
+RECOMMENDATION_CF_WEIGHT = 0.7  # collaborative vs category/level similarity
+RECOMMENDATION_CHUNK_STUDENTS = 4096
+GLOBAL_SEARCH_TIMEOUT_SECONDS = 0.5
+GLOBAL_SEARCH_PER_COLLECTION = 5
+ADMISSION_DEFAULT_CONCURRENCY = 64
+ADMISSION_QUEUE_SIZE = 128
+ADMISSION_QUEUE_TIMEOUT_SECONDS = 2.0
+ADMISSION_RETRY_AFTER_SECONDS = 1
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() not in ("0", "false", "no")
+RATE_LIMIT_IDLE_SWEEP_SECONDS = 60
+LOGIN_USERNAME_PER_MINUTE = 10  # password guesses per account, on top of the per-IP login policy
+LOGIN_USERNAME_BURST = 5
 
 # MongoDB connection
-MONGODB_URL = "mongodb://localhost:27017"
-client = motor.motor_asyncio.AsyncIOMotorClient(MONGODB_URL)
-database = client.eduteach
+MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
+MONGODB_DATABASE = os.getenv("MONGODB_DATABASE", "eduteach")
+MONGODB_MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", "5"))
+MONGODB_MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", "50"))
+MONGODB_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGODB_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGODB_CONNECT_TIMEOUT_MS = int(os.getenv("MONGODB_CONNECT_TIMEOUT_MS", "5000"))
+MONGODB_SOCKET_TIMEOUT_MS = int(os.getenv("MONGODB_SOCKET_TIMEOUT_MS", "20000"))
+MONGODB_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGODB_WAIT_QUEUE_TIMEOUT_MS", "2000"))
+MONGODB_COMPRESSORS = os.getenv("MONGODB_COMPRESSORS", "zlib")  # add zstd/snappy if their packages are installed
+MONGODB_MAX_STALENESS_SECONDS = int(os.getenv("MONGODB_MAX_STALENESS_SECONDS", "90"))
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """Connection pool counters for /metrics; called from the driver's threads."""
+
+    def __init__(self):
+        self.stats = {"created": 0, "closed": 0, "checked_out": 0, "checkout_failures": 0, "pool_cleared": 0}
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self.stats["pool_cleared"] += 1
+
+    def connection_created(self, event):
+        self.stats["created"] += 1
+
+    def connection_closed(self, event):
+        self.stats["closed"] += 1
+
+    def connection_checked_out(self, event):
+        self.stats["checked_out"] += 1
+
+    def connection_checked_in(self, event):
+        self.stats["checked_out"] -= 1
+
+    def connection_check_out_failed(self, event):
+        self.stats["checkout_failures"] += 1
+
+pool_monitor = PoolMonitor()
+
+# Set by connect_database() when the app starts, so each worker process
+# builds its own pool
+client = None
+database = None
+read_database = None  # secondaryPreferred, for list and statistics reads
+
+def connect_database():
+    global client, database, read_database
+    client = motor.motor_asyncio.AsyncIOMotorClient(
+        MONGODB_URL,
+        minPoolSize=MONGODB_MIN_POOL_SIZE,
+        maxPoolSize=MONGODB_MAX_POOL_SIZE,
+        serverSelectionTimeoutMS=MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+        connectTimeoutMS=MONGODB_CONNECT_TIMEOUT_MS,
+        socketTimeoutMS=MONGODB_SOCKET_TIMEOUT_MS,
+        waitQueueTimeoutMS=MONGODB_WAIT_QUEUE_TIMEOUT_MS,
+        compressors=MONGODB_COMPRESSORS,
+        event_listeners=[pool_monitor]
+    )
+    database = client[MONGODB_DATABASE]
+    read_database = client.get_database(
+        MONGODB_DATABASE, read_preference=SecondaryPreferred(max_staleness=MONGODB_MAX_STALENESS_SECONDS)
+    )
+
+def database_metrics() -> dict:
+    return {
+        "pool": {**pool_monitor.stats, "min_size": MONGODB_MIN_POOL_SIZE, "max_size": MONGODB_MAX_POOL_SIZE},
+        "timeouts_ms": {
+            "server_selection": MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+            "connect": MONGODB_CONNECT_TIMEOUT_MS,
+            "socket": MONGODB_SOCKET_TIMEOUT_MS,
+            "wait_queue": MONGODB_WAIT_QUEUE_TIMEOUT_MS
+        },
+        "compressors": MONGODB_COMPRESSORS,
+        "list_read_preference": read_database.read_preference.mongos_mode if read_database is not None else None
+    }
+
+@asynccontextmanager
+async def lifespan(app):
+    connect_database()
+    await startup()
+    yield
+    await shutdown()
+    client.close()
 
 # FastAPI app
-app = FastAPI(title="EduTeach API", description="API for Online Teaching Management System")
+app = FastAPI(
+    title="EduTeach API",
+    description="API for Online Teaching Management System",
+    lifespan=lifespan
+)
 
 # CORS middleware
 app.add_middleware(
@@ -34,6 +206,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
 # Password hashing
@@ -82,6 +255,12 @@ class Course(CourseBase):
     image_url: Optional[str] = None
     created_at: datetime
 
+class Enrollment(BaseModel):
+    id: str
+    course_id: str
+    student_id: str
+    enrolled_at: datetime
+
 class AssignmentBase(BaseModel):
     title: str
     description: Optional[str] = None
@@ -98,6 +277,22 @@ class Assignment(AssignmentBase):
     status: str = "pending"
     created_at: datetime
 
+class Submission(BaseModel):
+    id: str
+    assignment_id: str
+    student_id: str
+    content: Optional[str] = None
+    file_url: Optional[str] = None
+    status: str = "submitted"  # submitted, graded
+    score: Optional[float] = None
+    feedback: Optional[str] = None
+    submitted_at: datetime
+    graded_at: Optional[datetime] = None
+
+class GradeCreate(BaseModel):
+    score: float
+    feedback: Optional[str] = None
+
 class ExamBase(BaseModel):
     title: str
     description: Optional[str] = None
@@ -116,6 +311,29 @@ class Exam(ExamBase):
     status: str = "upcoming"
     created_at: datetime
 
+class ExamSession(BaseModel):
+    id: str
+    exam_id: str
+    student_id: str
+    status: str = "in_progress"  # in_progress, submitted
+    answers: Dict[str, str] = {}
+    started_at: datetime
+    deadline: datetime
+    submitted_at: Optional[datetime] = None
+    auto_submitted: bool = False
+    score: Optional[float] = None
+    graded_at: Optional[datetime] = None
+    remaining_seconds: int = 0
+
+class AnswerBatch(BaseModel):
+    answers: Dict[str, str]  # question index -> answer
+
+class AnswerKeyCreate(BaseModel):
+    answers: List[str]  # one entry per question, in order
+    types: Optional[List[str]] = None  # "choice" (default) or "numeric"
+    points: Optional[List[float]] = None
+    tolerance: Optional[List[float]] = None  # absolute tolerance for numeric questions
+
 class WebinarBase(BaseModel):
     title: str
     description: Optional[str] = None
@@ -135,6 +353,14 @@ class Webinar(WebinarBase):
     thumbnail_url: Optional[str] = None
     created_at: datetime
 
+class WebinarRegistration(BaseModel):
+    id: str
+    webinar_id: str
+    user_id: str
+    user_name: str
+    status: str = "registered"  # registered, waitlisted
+    registered_at: datetime
+
 class StudentBase(BaseModel):
     full_name: str
     email: EmailStr
@@ -172,6 +398,7 @@ class LibraryDocument(LibraryDocumentBase):
     file_url: str
     file_size: int
     views: int = 0
+    unique_viewers: int = 0
     downloads: int = 0
     created_at: datetime
 
@@ -191,9 +418,37 @@ class ForumTopic(ForumTopicBase):
     author_name: str
     author_avatar: Optional[str] = None
     views: int = 0
+    unique_viewers: int = 0
     replies: int = 0
+    last_activity_at: Optional[datetime] = None
+    hot_score: Optional[float] = None
+    created_at: datetime
+
+class ForumReplyCreate(BaseModel):
+    content: str
+    parent_id: Optional[str] = None  # reply being answered, if any
+
+class ForumReply(ForumReplyCreate):
+    id: str
+    topic_id: str
+    author_id: str
+    author_name: str
+    author_avatar: Optional[str] = None
     created_at: datetime
 
+class ForumReplyPage(BaseModel):
+    replies: List[ForumReply]
+    next_cursor: Optional[str] = None
+
+class CalendarEvent(BaseModel):
+    id: str
+    type: str  # assignment, exam, webinar
+    title: str
+    date: datetime
+    duration_minutes: Optional[int] = None
+    course_id: Optional[str] = None
+    status: Optional[str] = None
+
 class Statistics(BaseModel):
     total_courses: int
     total_assignments: int
@@ -243,6 +498,12 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     user["id"] = str(user["_id"])
     return User(**user)
 
+def to_naive_utc(value: datetime) -> datetime:
+    """Query bounds may carry an offset (Date.toISOString() sends Z); Mongo stores naive UTC."""
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
 def convert_objectid(doc):
     """Convert MongoDB ObjectId to string"""
     if doc:
@@ -250,6 +511,833 @@ def convert_objectid(doc):
         del doc["_id"]
     return doc
 
+# Read-through document cache
+class DocumentCache:
+    """Bounded LRU cache of raw documents keyed by (collection, _id)."""
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()  # (collection, id) -> (expires_at, doc)
+        self.stats = {}  # collection -> {"hits", "misses", "invalidations"}
+
+    def _stats(self, collection):
+        return self.stats.setdefault(collection, {"hits": 0, "misses": 0, "invalidations": 0})
+
+    def get(self, collection: str, doc_id: str):
+        key = (collection, doc_id)
+        entry = self.entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self.entries[key]
+            self._stats(collection)["misses"] += 1
+            return None
+        self.entries.move_to_end(key)
+        self._stats(collection)["hits"] += 1
+        return dict(entry[1])
+
+    def set(self, collection: str, doc_id: str, doc: dict):
+        key = (collection, doc_id)
+        self.entries[key] = (time.monotonic() + self.ttl_seconds, dict(doc))
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, collection: str, doc_id: Optional[str] = None):
+        """Drop one document, or every cached document of the collection."""
+        if doc_id is not None:
+            keys = [(collection, doc_id)]
+        else:
+            keys = [key for key in self.entries if key[0] == collection]
+        for key in keys:
+            if self.entries.pop(key, None) is not None:
+                self._stats(collection)["invalidations"] += 1
+
+    def clear(self):
+        self.entries.clear()
+
+    def metrics(self):
+        return {"size": len(self.entries), "max_size": self.max_size, "collections": self.stats}
+
+document_cache = DocumentCache(DOCUMENT_CACHE_SIZE, DOCUMENT_CACHE_TTL_SECONDS)
+
+async def find_one_cached(collection: str, doc_id: str):
+    doc = document_cache.get(collection, doc_id)
+    if doc is None:
+        doc = await database[collection].find_one({"_id": ObjectId(doc_id)})
+        if doc is not None:
+            document_cache.set(collection, doc_id, doc)
+    return doc
+
+# Cross-worker cache invalidation
+INVALIDATION_COLLECTIONS = [
+    "users", "courses", "library", "forum",
+    "assignments", "exams", "webinars", "students", "enrollments",
+]
+
+invalidation_subscribers = []
+known_collection_versions = {}  # collection -> last version seen by this worker
+
+background_tasks = set()
+
+def run_in_background(coro, description: str):
+    """Fire-and-forget a coroutine, keeping a reference and logging failures."""
+    task = asyncio.ensure_future(coro)
+    background_tasks.add(task)
+
+    def finished(task):
+        background_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("%s failed", description, exc_info=task.exception())
+
+    task.add_done_callback(finished)
+    return task
+
+def subscribe_invalidation(callback):
+    """Register callback(collection, doc_id, fields).
+
+    doc_id None means the whole collection; fields is the set of top-level
+    fields an update touched, or None when unknown (inserts, deletes,
+    record_write).
+    """
+    invalidation_subscribers.append(callback)
+    return callback
+
+def publish_invalidation(collection: str, doc_id: Optional[str] = None, fields: Optional[set] = None):
+    for callback in invalidation_subscribers:
+        callback(collection, doc_id, fields)
+
+def touches(fields: Optional[set], *names) -> bool:
+    return fields is None or any(name in fields for name in names)
+
+async def record_write(collection: str, doc_id: Optional[str] = None):
+    """Invalidate local caches and bump the shared version other workers poll."""
+    publish_invalidation(collection, doc_id)
+    version_doc = await database.collection_versions.find_one_and_update(
+        {"_id": collection},
+        # Capped log of the ids behind recent versions, so polling workers
+        # can refresh single documents instead of whole collections
+        {"$inc": {"version": 1}, "$push": {"changes": {"$each": [doc_id], "$slice": -INVALIDATION_CHANGE_LOG_SIZE}}},
+        projection={"version": 1},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    # Only advance our own watermark when no other worker wrote in between,
+    # otherwise the poller must still see the gap and invalidate.
+    if known_collection_versions.get(collection, 0) == version_doc["version"] - 1:
+        known_collection_versions[collection] = version_doc["version"]
+
+async def supports_change_streams():
+    try:
+        hello = await database.command("hello")
+    except (PyMongoError, NotImplementedError):
+        return False
+    return "setName" in hello or hello.get("msg") == "isdbgrid"
+
+async def watch_change_stream():
+    pipeline = [{"$match": {"ns.coll": {"$in": INVALIDATION_COLLECTIONS}}}]
+    resume_token = None
+    while True:
+        try:
+            async with database.watch(pipeline, resume_after=resume_token) as stream:
+                async for change in stream:
+                    resume_token = stream.resume_token
+                    doc_id = change.get("documentKey", {}).get("_id")
+                    fields = None
+                    if change.get("operationType") == "update":
+                        description = change.get("updateDescription", {})
+                        changed = [*description.get("updatedFields", {}), *description.get("removedFields", [])]
+                        fields = {name.split(".")[0] for name in changed}
+                    publish_invalidation(change["ns"]["coll"], str(doc_id) if doc_id else None, fields)
+        except PyMongoError as e:
+            logger.warning("Change stream interrupted, resuming: %s", e)
+            await asyncio.sleep(INVALIDATION_POLL_SECONDS)
+
+def logged_changes(version_doc: dict, missed: int) -> Optional[list]:
+    """Doc ids behind the last `missed` versions, or None if the log can't name them all."""
+    changes = version_doc.get("changes", [])
+    if missed <= 0 or missed > len(changes):
+        return None
+    recent = changes[-missed:]
+    return None if None in recent else recent
+
+async def poll_collection_versions():
+    while True:
+        try:
+            async for version_doc in database.collection_versions.find(
+                {"_id": {"$in": INVALIDATION_COLLECTIONS}}
+            ):
+                collection, version = version_doc["_id"], version_doc["version"]
+                known = known_collection_versions.get(collection)
+                if known is not None and known != version:
+                    doc_ids = logged_changes(version_doc, version - known)
+                    if doc_ids is None:
+                        publish_invalidation(collection)
+                    else:
+                        for doc_id in dict.fromkeys(doc_ids):
+                            publish_invalidation(collection, doc_id)
+                known_collection_versions[collection] = version
+        except PyMongoError as e:
+            logger.warning("Collection version poll failed: %s", e)
+        await asyncio.sleep(INVALIDATION_POLL_SECONDS)
+
+async def watch_invalidations():
+    if await supports_change_streams():
+        await watch_change_stream()
+    else:
+        await poll_collection_versions()
+
+@subscribe_invalidation
+def invalidate_document_cache(collection: str, doc_id: Optional[str], fields: Optional[set]):
+    document_cache.invalidate(collection, doc_id)
+
+# Request coalescing
+class SingleFlight:
+    """Run one query per key at a time and hand its result to every caller.
+
+    Keys must capture everything that changes the result, including what
+    the caller is allowed to see. Results are shared, so callers must not
+    mutate them.
+    """
+
+    def __init__(self):
+        self.calls = {}  # key -> in-flight task
+        self.stats = {"executed": 0, "shared": 0}
+
+    async def do(self, key, factory):
+        task = self.calls.get(key)
+        if task is None:
+            self.stats["executed"] += 1
+            task = asyncio.ensure_future(factory())
+            self.calls[key] = task
+            task.add_done_callback(lambda _: self.calls.pop(key, None))
+        else:
+            self.stats["shared"] += 1
+        # A caller that disconnects must not cancel the query for the others
+        return await asyncio.shield(task)
+
+    def metrics(self) -> dict:
+        return {**self.stats, "in_flight": len(self.calls)}
+
+single_flight = SingleFlight()
+
+# Conditional GET helpers
+async def collection_etag(collection: str, *parts, depends_on=()) -> str:
+    """Weak ETag from the collection version counter and the query parameters.
+
+    depends_on names other collections whose writes change the body, like
+    enrollments for course counts. Views still move without a version
+    change, so the tag is weak: bodies differing only in views are equivalent.
+    """
+    names = [collection, *depends_on]
+    # Not coalesced: a shared read issued before our own write would tag
+    # the new body with the old version and hand out stale 304s
+    versions = {
+        doc["_id"]: doc["version"]
+        async for doc in database.collection_versions.find({"_id": {"$in": names}}, {"version": 1})
+    }
+    version = ".".join(str(versions.get(name, 0)) for name in names)
+    digest = hashlib.md5(repr(parts).encode()).hexdigest()[:12]
+    return f'W/"{collection}-{version}-{digest}"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return etag.removeprefix("W/") in tags
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag})
+
+# Activity log and time-series rollups
+ROLLUP_GRANULARITIES = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+
+def rollup_bucket(at: datetime, granularity: str) -> datetime:
+    hour = to_naive_utc(at).replace(minute=0, second=0, microsecond=0)
+    return hour if granularity == "hour" else hour.replace(hour=0)
+
+class ActivityRecorder:
+    """Buffers activity events and their hourly/daily rollup increments.
+
+    Raw events go to activity_events (expired by a TTL index); counts are
+    folded into activity_rollups buckets with one upserting $inc per bucket
+    per flush, so a burst of enrollments doesn't hammer one hot bucket.
+    """
+
+    def __init__(self):
+        self.events = []
+        self.counts = {}  # (type, granularity, bucket) -> count
+        self.stats = {"flushes": 0, "events": 0}
+
+    def record(self, event_type: str, ref_id: Optional[str] = None, user_id: Optional[str] = None):
+        now = datetime.utcnow()
+        self.events.append({"type": event_type, "ref_id": ref_id, "user_id": user_id, "at": now})
+        for granularity in ROLLUP_GRANULARITIES:
+            key = (event_type, granularity, rollup_bucket(now, granularity))
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    async def flush(self):
+        events, self.events = self.events, []
+        counts, self.counts = self.counts, {}
+        flushed = len(events)
+        try:
+            if events:
+                await database.activity_events.insert_many(events, ordered=False)
+                events = []  # don't replay them if the rollup write fails
+            if counts:
+                await database.activity_rollups.bulk_write([
+                    UpdateOne(
+                        {"_id": f"{event_type}:{granularity}:{bucket.isoformat()}"},
+                        {"$inc": {"count": count},
+                         "$setOnInsert": {"type": event_type, "granularity": granularity, "bucket": bucket}},
+                        upsert=True
+                    )
+                    for (event_type, granularity, bucket), count in counts.items()
+                ], ordered=False)
+        except PyMongoError:
+            self.events = events + self.events
+            for key, count in counts.items():
+                self.counts[key] = self.counts.get(key, 0) + count
+            raise
+        self.stats["flushes"] += 1
+        self.stats["events"] += flushed
+
+    async def compact(self):
+        """Drop hourly buckets past retention; daily buckets cover that range."""
+        cutoff = datetime.utcnow() - timedelta(days=HOURLY_ROLLUP_RETENTION_DAYS)
+        await database.activity_rollups.delete_many({"granularity": "hour", "bucket": {"$lt": cutoff}})
+
+activity = ActivityRecorder()
+
+async def run_activity_flusher():
+    last_compaction = 0.0
+    while True:
+        await asyncio.sleep(ACTIVITY_FLUSH_SECONDS)
+        try:
+            await activity.flush()
+            if time.monotonic() - last_compaction > 3600:
+                await activity.compact()
+                last_compaction = time.monotonic()
+        except PyMongoError as e:
+            logger.warning("Activity flush failed: %s", e)
+
+# Response compression
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript")
+compression_cache = OrderedDict()  # (encoding, body digest) -> compressed body
+compression_stats = {"compressed": 0, "cache_hits": 0, "streamed": 0, "bytes_in": 0, "bytes_out": 0}
+
+class CompressionMiddleware:
+    """Gzip/brotli response compression with a reuse cache for identical bodies.
+
+    Complete bodies above the size threshold are compressed in one shot and
+    memoized by content hash, so repeated list payloads are only compressed
+    once. Streaming bodies are compressed chunk by chunk.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MINIMUM_SIZE, cache_size: int = COMPRESSION_CACHE_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.cache_size = cache_size
+
+    def choose_encoding(self, scope):
+        accept = ""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept = value.decode("latin-1").lower()
+        weights = {}
+        for part in accept.split(","):
+            name, *params = [piece.strip() for piece in part.split(";")]
+            weight = 1.0
+            for param in params:
+                if param.startswith("q="):
+                    try:
+                        weight = float(param[2:])
+                    except ValueError:
+                        weight = 0.0
+            if name:
+                weights[name] = weight
+        def acceptable(encoding):
+            return weights.get(encoding, weights.get("*", 0.0)) > 0
+        if brotli is not None and acceptable("br"):
+            return "br"
+        if acceptable("gzip"):
+            return "gzip"
+        return None
+
+    def compressor(self, encoding):
+        if encoding == "br":
+            return brotli.Compressor(quality=4)
+        return zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    def compress(self, encoding, body: bytes) -> bytes:
+        cacheable = len(body) <= COMPRESSION_CACHE_MAX_BODY
+        if cacheable:
+            key = (encoding, hashlib.blake2b(body, digest_size=16).digest())
+            cached = compression_cache.get(key)
+            if cached is not None:
+                compression_cache.move_to_end(key)
+                compression_stats["cache_hits"] += 1
+                return cached
+        if encoding == "br":
+            compressed = brotli.compress(body, quality=4)
+        else:
+            compressor = self.compressor(encoding)
+            compressed = compressor.compress(body) + compressor.flush()
+        compression_stats["compressed"] += 1
+        if cacheable:
+            compression_cache[key] = compressed
+            while len(compression_cache) > self.cache_size:
+                compression_cache.popitem(last=False)
+        return compressed
+
+    async def send_identity(self, scope, receive, send):
+        # The response would differ for another Accept-Encoding, so caches must know
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = {name.lower(): value for name, value in message.get("headers", [])}
+                content_type = headers.get(b"content-type", b"").decode("latin-1")
+                if b"content-encoding" not in headers and content_type.startswith(COMPRESSIBLE_TYPES):
+                    message = {**message, "headers": [*message.get("headers", []), (b"vary", b"Accept-Encoding")]}
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = self.choose_encoding(scope)
+        if encoding is None:
+            await self.send_identity(scope, receive, send)
+            return
+
+        start_message = None
+        compressor = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, compressor, passthrough
+            if message["type"] == "http.response.start":
+                headers = {name.lower(): value for name, value in message.get("headers", [])}
+                content_type = headers.get(b"content-type", b"").decode("latin-1")
+                passthrough = (
+                    b"content-encoding" in headers
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)
+                )
+                if passthrough:
+                    await send(message)
+                else:
+                    start_message = message
+                return
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start_message is not None:
+                start, start_message = start_message, None
+                headers = [(k, v) for k, v in start.get("headers", []) if k.lower() != b"content-length"]
+                if not more_body and len(body) < self.minimum_size:
+                    passthrough = True
+                    await send({**start, "headers": [*start.get("headers", []), (b"vary", b"Accept-Encoding")]})
+                    await send(message)
+                    return
+                headers.append((b"content-encoding", encoding.encode()))
+                headers.append((b"vary", b"Accept-Encoding"))
+                if not more_body:
+                    compressed = self.compress(encoding, body)
+                    compression_stats["bytes_in"] += len(body)
+                    compression_stats["bytes_out"] += len(compressed)
+                    headers.append((b"content-length", str(len(compressed)).encode()))
+                    await send({**start, "headers": headers})
+                    await send({"type": "http.response.body", "body": compressed})
+                    return
+                compressor = self.compressor(encoding)
+                compression_stats["streamed"] += 1
+                await send({**start, "headers": headers})
+
+            # Streaming body: flush each chunk so clients see data promptly
+            if encoding == "br":
+                chunk = compressor.process(body) + (compressor.flush() if more_body else compressor.finish())
+            else:
+                chunk = compressor.compress(body) + compressor.flush(zlib.Z_SYNC_FLUSH if more_body else zlib.Z_FINISH)
+            compression_stats["bytes_in"] += len(body)
+            compression_stats["bytes_out"] += len(chunk)
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
+
+def compression_metrics():
+    return {**compression_stats, "cache_size": len(compression_cache), "brotli": brotli is not None}
+
+app.add_middleware(CompressionMiddleware)
+
+# Admission control
+UPLOAD_PATHS = re.compile(r"^/(library/upload|users/avatar|assignments/[^/]+/submissions)$")
+
+ADMISSION_ROUTE_LIMITS = [
+    # (limiter name, path pattern, methods or None for any, max concurrent requests)
+    ("register", re.compile(r"^/register$"), None, 4),
+    ("uploads", UPLOAD_PATHS, {"POST"}, 4),
+    ("grading", re.compile(r"^/exams/[^/]+/grade$"), None, 2),
+    ("analytics", re.compile(r"^/(analytics/|courses/[^/]+/analytics|search/global)"), None, 8),
+]
+ADMISSION_EXEMPT_PATHS = {"/health", "/metrics"}
+ADMISSION_PRIORITY_PATHS = {"/token"}  # jump the queue: nobody can work without logging in
+
+class ConcurrencyLimiter:
+    """At most `limit` requests in flight; the rest wait in a bounded priority queue."""
+
+    def __init__(self, limit: int, queue_size: int):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.active = 0
+        self.waiters = []  # heap of (priority, seq, future)
+        self.seq = 0
+        self.stats = {"admitted": 0, "queued": 0, "shed_queue_full": 0, "shed_timeout": 0}
+
+    async def acquire(self, priority: int, timeout: float) -> bool:
+        if self.active < self.limit and not self.waiters:
+            self.active += 1
+            self.stats["admitted"] += 1
+            return True
+        if len(self.waiters) >= self.queue_size and priority > 0:
+            self.stats["shed_queue_full"] += 1
+            return False
+        
+        future = asyncio.get_running_loop().create_future()
+        entry = (priority, self.seq, future)
+        self.seq += 1
+        heapq.heappush(self.waiters, entry)
+        self.stats["queued"] += 1
+        try:
+            await asyncio.wait({future}, timeout=timeout)
+        except asyncio.CancelledError:
+            # Client went away while queued; give back a slot handed over meanwhile
+            if future.done():
+                self.release()
+            else:
+                self.abandon(entry)
+            raise
+        if not future.done():
+            self.abandon(entry)
+            self.stats["shed_timeout"] += 1
+            return False
+        self.stats["admitted"] += 1
+        return True
+
+    def abandon(self, entry):
+        self.waiters.remove(entry)
+        heapq.heapify(self.waiters)
+
+    def release(self):
+        # Hand the slot straight to the next waiter so it cannot be stolen
+        if self.waiters:
+            _, _, future = heapq.heappop(self.waiters)
+            future.set_result(None)
+        else:
+            self.active -= 1
+
+    def metrics(self) -> dict:
+        return {**self.stats, "limit": self.limit, "active": self.active, "waiting": len(self.waiters)}
+
+admission_limiters = {
+    name: ConcurrencyLimiter(limit, ADMISSION_QUEUE_SIZE) for name, _, _, limit in ADMISSION_ROUTE_LIMITS
+}
+admission_limiters["default"] = ConcurrencyLimiter(ADMISSION_DEFAULT_CONCURRENCY, ADMISSION_QUEUE_SIZE)
+
+async def send_early_response(scope, send, status_code: int, detail: str, retry_after: int):
+    """JSON error with Retry-After for requests refused before reaching the app."""
+    headers = [
+        (b"content-type", b"application/json"),
+        (b"retry-after", str(retry_after).encode()),
+    ]
+    # Sent before CORSMiddleware runs, so let the browser read the response
+    for name, value in scope["headers"]:
+        if name == b"origin":
+            headers.append((b"access-control-allow-origin", value))
+            headers.append((b"access-control-allow-credentials", b"true"))
+            headers.append((b"access-control-expose-headers", b"Retry-After"))
+    await send({"type": "http.response.start", "status": status_code, "headers": headers})
+    await send({"type": "http.response.body", "body": json.dumps({"detail": detail}).encode()})
+
+class AdmissionControlMiddleware:
+    """Bound concurrent requests per route group and shed what cannot start in time.
+
+    Rejected requests get a fast 503 with Retry-After instead of piling up
+    behind the Motor pool and dragging every other request's latency up.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    def limiter_for(self, method: str, path: str) -> ConcurrencyLimiter:
+        for name, pattern, methods, _ in ADMISSION_ROUTE_LIMITS:
+            if pattern.match(path) and (methods is None or method in methods):
+                return admission_limiters[name]
+        return admission_limiters["default"]
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        if scope["type"] != "http" or scope["method"] == "OPTIONS" or path in ADMISSION_EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
+        
+        limiter = self.limiter_for(scope["method"], path)
+        priority = 0 if path in ADMISSION_PRIORITY_PATHS else 1
+        if not await limiter.acquire(priority, ADMISSION_QUEUE_TIMEOUT_SECONDS):
+            await send_early_response(
+                scope, send, 503, "Server is busy, please retry shortly", ADMISSION_RETRY_AFTER_SECONDS
+            )
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
+
+app.add_middleware(AdmissionControlMiddleware)
+
+# Rate limiting
+RATE_LIMIT_POLICIES = [
+    # (policy name, path pattern, methods or None for any, keyed by "ip" or "user", requests per minute, burst)
+    # Generous per IP so a classroom behind one NAT can log in at exam start;
+    # guessing is bounded per username in login() instead
+    ("login", re.compile(r"^/token$"), None, "ip", 300, 300),
+    ("register", re.compile(r"^/register$"), None, "ip", 3, 3),
+    # POST only, so listing submissions isn't throttled like uploading one
+    ("uploads", UPLOAD_PATHS, {"POST"}, "user", 10, 5),
+]
+
+class RateLimitBackend(ABC):
+    """Token bucket storage. Implement take() on a shared store to limit across workers."""
+
+    @abstractmethod
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        """Spend one token; return 0 if allowed, else seconds until one is available."""
+
+    def metrics(self) -> dict:
+        return {}
+
+class InMemoryRateLimitBackend(RateLimitBackend):
+    """Per-worker buckets stored as (tokens, updated_at, idle_expiry) tuples.
+
+    A bucket left alone until it has refilled completely is indistinguishable
+    from a new one, so the periodic sweep simply drops it.
+    """
+
+    def __init__(self):
+        self.buckets = {}  # key -> (tokens, updated_at, idle_expiry)
+        self.next_sweep = time.monotonic() + RATE_LIMIT_IDLE_SWEEP_SECONDS
+        self.evicted = 0
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        now = time.monotonic()
+        if now >= self.next_sweep:
+            self.sweep(now)
+        tokens, updated_at, _ = self.buckets.get(key, (burst, now, now))
+        tokens = min(burst, tokens + (now - updated_at) * rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self.buckets[key] = (tokens, now, now + (burst - tokens) / rate)
+        return 0 if allowed else (1 - tokens) / rate
+
+    def sweep(self, now: float):
+        idle = [key for key, bucket in self.buckets.items() if bucket[2] <= now]
+        for key in idle:
+            del self.buckets[key]
+        self.evicted += len(idle)
+        self.next_sweep = now + RATE_LIMIT_IDLE_SWEEP_SECONDS
+
+    def metrics(self) -> dict:
+        return {"buckets": len(self.buckets), "evicted": self.evicted}
+
+rate_limit_backend = InMemoryRateLimitBackend()
+rate_limit_stats = {name: {"allowed": 0, "limited": 0} for name, *_ in RATE_LIMIT_POLICIES}
+rate_limit_stats["login_username"] = {"allowed": 0, "limited": 0}
+
+async def enforce_rate_limit(name: str, identity: str, per_minute: int, burst: int):
+    """Token bucket check for limits keyed on request data the middleware can't see."""
+    if not RATE_LIMIT_ENABLED:
+        return
+    wait = await rate_limit_backend.take(f"{name}:{identity}", per_minute / 60, burst)
+    if wait:
+        rate_limit_stats[name]["limited"] += 1
+        raise HTTPException(
+            status_code=429, detail="Too many requests, please slow down",
+            headers={"Retry-After": str(math.ceil(wait))}
+        )
+    rate_limit_stats[name]["allowed"] += 1
+
+def rate_limit_identity(scope, key_by: str) -> str:
+    """Authenticated uploads are limited per user, everything else per client IP."""
+    if key_by == "user":
+        for name, value in scope["headers"]:
+            if name == b"authorization" and value.lower().startswith(b"bearer "):
+                try:
+                    payload = jwt.decode(value[7:].decode("latin-1"), SECRET_KEY, algorithms=[ALGORITHM])
+                except JWTError:
+                    break
+                if payload.get("sub"):
+                    return "user:" + payload["sub"]
+    client = scope.get("client")
+    return "ip:" + (client[0] if client else "unknown")
+
+class RateLimitMiddleware:
+    """Token bucket per (policy, identity); over-limit requests get 429 + Retry-After."""
+
+    def __init__(self, app, backend: Optional[RateLimitBackend] = None):
+        self.app = app
+        self.backend = backend or rate_limit_backend
+
+    async def __call__(self, scope, receive, send):
+        if RATE_LIMIT_ENABLED and scope["type"] == "http" and scope["method"] != "OPTIONS":
+            for name, pattern, methods, key_by, per_minute, burst in RATE_LIMIT_POLICIES:
+                if not pattern.match(scope["path"]) or (methods is not None and scope["method"] not in methods):
+                    continue
+                key = f"{name}:{rate_limit_identity(scope, key_by)}"
+                wait = await self.backend.take(key, per_minute / 60, burst)
+                if wait:
+                    rate_limit_stats[name]["limited"] += 1
+                    await send_early_response(
+                        scope, send, 429, "Too many requests, please slow down", math.ceil(wait)
+                    )
+                    return
+                rate_limit_stats[name]["allowed"] += 1
+                break
+        await self.app(scope, receive, send)
+
+app.add_middleware(RateLimitMiddleware)
+
+# Autocomplete prefix index
+AUTOCOMPLETE_FIELDS = {
+    "courses": "title",
+    "students": "full_name",
+    "library": "title",
+}
+
+def fold_text(text: str) -> str:
+    """Lowercase and strip accents so "Khóa học" matches "khoa hoc"."""
+    text = unicodedata.normalize("NFD", text.replace("đ", "d").replace("Đ", "D"))
+    return "".join(c for c in text if not unicodedata.combining(c)).lower()
+
+class PrefixIndex:
+    """Sorted array of folded keys answered with binary search.
+
+    Every word of a label starts its own key so "react" also matches
+    "Khóa học React Advanced".
+    """
+
+    def __init__(self):
+        self.keys = []  # sorted (folded_key, doc_id) pairs
+        self.labels = {}  # doc_id -> original label
+        self.owners = {}  # doc_id -> owner id, only for private entries
+
+    def _keys_for(self, label):
+        words = fold_text(label).split()
+        return [" ".join(words[i:]) for i in range(len(words))]
+
+    @classmethod
+    def build(cls, entries) -> "PrefixIndex":
+        """Bulk load (doc_id, label, owner) entries with one sort instead of an insort each."""
+        index = cls()
+        for doc_id, label, owner in entries:
+            index.labels[doc_id] = label
+            if owner is not None:
+                index.owners[doc_id] = owner
+            index.keys.extend((key, doc_id) for key in index._keys_for(label))
+        index.keys.sort()
+        return index
+
+    def add(self, doc_id: str, label: str, owner: Optional[str] = None):
+        if doc_id in self.labels:
+            self.remove(doc_id)
+        self.labels[doc_id] = label
+        if owner is not None:
+            self.owners[doc_id] = owner
+        for key in self._keys_for(label):
+            bisect.insort(self.keys, (key, doc_id))
+
+    def remove(self, doc_id: str):
+        label = self.labels.pop(doc_id, None)
+        self.owners.pop(doc_id, None)
+        if label is None:
+            return
+        for key in self._keys_for(label):
+            i = bisect.bisect_left(self.keys, (key, doc_id))
+            if i < len(self.keys) and self.keys[i] == (key, doc_id):
+                del self.keys[i]
+
+    def search(self, prefix: str, limit: int = 10, viewer: Optional[str] = None):
+        """Private entries are only returned to their owner; viewer=None sees everything."""
+        prefix = " ".join(fold_text(prefix).split())
+        if not prefix:
+            return []
+        results = []
+        seen = set()
+        i = bisect.bisect_left(self.keys, (prefix,))
+        while i < len(self.keys) and len(results) < limit:
+            key, doc_id = self.keys[i]
+            if not key.startswith(prefix):
+                break
+            owner = self.owners.get(doc_id)
+            if doc_id not in seen and (viewer is None or owner is None or owner == viewer):
+                seen.add(doc_id)
+                results.append({"id": doc_id, "label": self.labels[doc_id]})
+            i += 1
+        return results
+
+autocomplete_indexes = {name: PrefixIndex() for name in AUTOCOMPLETE_FIELDS}
+
+def autocomplete_owner(collection: str, doc: dict) -> Optional[str]:
+    """Private library documents are only suggested to their author."""
+    if collection == "library" and not doc.get("is_public", True):
+        return doc.get("author_id", "")
+    return None
+
+def autocomplete_projection(collection: str) -> dict:
+    return {AUTOCOMPLETE_FIELDS[collection]: 1, "is_public": 1, "author_id": 1}
+
+def index_for_autocomplete(collection: str, doc: dict):
+    field = AUTOCOMPLETE_FIELDS[collection]
+    if doc.get(field):
+        autocomplete_indexes[collection].add(
+            str(doc.get("_id", doc.get("id"))), doc[field], autocomplete_owner(collection, doc)
+        )
+
+async def load_autocomplete_indexes(collections=None):
+    for collection in collections or AUTOCOMPLETE_FIELDS:
+        field = AUTOCOMPLETE_FIELDS[collection]
+        entries = []
+        async for doc in database[collection].find({}, autocomplete_projection(collection)):
+            if doc.get(field):
+                entries.append((str(doc["_id"]), doc[field], autocomplete_owner(collection, doc)))
+        autocomplete_indexes[collection] = PrefixIndex.build(entries)
+
+async def refresh_autocomplete_entry(collection: str, doc_id: str):
+    field = AUTOCOMPLETE_FIELDS[collection]
+    doc = await database[collection].find_one({"_id": ObjectId(doc_id)}, autocomplete_projection(collection))
+    if doc and doc.get(field):
+        autocomplete_indexes[collection].add(doc_id, doc[field], autocomplete_owner(collection, doc))
+    else:
+        autocomplete_indexes[collection].remove(doc_id)
+
+@subscribe_invalidation
+def invalidate_autocomplete(collection: str, doc_id: Optional[str], fields: Optional[set]):
+    if collection not in AUTOCOMPLETE_FIELDS:
+        return
+    # Counter and sketch updates (views, viewer_hll) don't change suggestions
+    if not touches(fields, AUTOCOMPLETE_FIELDS[collection], "is_public", "author_id"):
+        return
+    if doc_id is None:
+        run_in_background(load_autocomplete_indexes([collection]), "Autocomplete reload")
+    else:
+        run_in_background(refresh_autocomplete_entry(collection, doc_id), "Autocomplete refresh")
+
 # Authentication endpoints
 @app.post("/register", response_model=User)
 async def register(user: UserCreate):
@@ -269,12 +1357,17 @@ async def register(user: UserCreate):
     user_dict["is_active"] = True
     
     result = await database.users.insert_one(user_dict)
+    activity.record("user_registration", str(result.inserted_id))
     created_user = await database.users.find_one({"_id": result.inserted_id})
+    await record_write("users", str(result.inserted_id))
     
     return User(**convert_objectid(created_user))
 
 @app.post("/token", response_model=Token)
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
+    await enforce_rate_limit(
+        "login_username", form_data.username.strip().lower(), LOGIN_USERNAME_PER_MINUTE, LOGIN_USERNAME_BURST
+    )
     user = await database.users.find_one({"email": form_data.username})
     if not user or not verify_password(form_data.password, user["password"]):
         raise HTTPException(
@@ -318,6 +1411,7 @@ async def upload_avatar(
         {"email": current_user.email},
         {"$set": {"avatar_url": avatar_url}}
     )
+    await record_write("users", current_user.id)
     
     return {"avatar_url": avatar_url}
 
@@ -337,15 +1431,24 @@ async def get_available_avatars():
 # Course endpoints
 @app.get("/courses", response_model=List[Course])
 async def get_courses(
+    request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     current_user: User = Depends(get_current_user)
 ):
+    etag = await collection_etag("courses", skip, limit, depends_on=("enrollments",))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    
     courses = []
     async for course in database.courses.find().skip(skip).limit(limit):
-        course_data = convert_objectid(course)
-        courses.append(Course(**course_data))
-    return courses
+        courses.append(convert_objectid(course))
+    counts = await enrollment_counts([course["id"] for course in courses])
+    for course in courses:
+        course["enrolled_students"] = course.get("enrolled_students", 0) + counts.get(course["id"], 0)
+    return [Course(**course) for course in courses]
 
 @app.post("/courses", response_model=Course)
 async def create_course(
@@ -362,20 +1465,157 @@ async def create_course(
     
     result = await database.courses.insert_one(course_dict)
     created_course = await database.courses.find_one({"_id": result.inserted_id})
+    await record_write("courses", str(result.inserted_id))
+    index_for_autocomplete("courses", created_course)
     
     return Course(**convert_objectid(created_course))
 
 @app.get("/courses/{course_id}", response_model=Course)
 async def get_course(
     course_id: str,
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_user)
 ):
-    course = await database.courses.find_one({"_id": ObjectId(course_id)})
+    etag = await collection_etag("courses", course_id, depends_on=("enrollments",))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    
+    course = await single_flight.do(("course", course_id), lambda: load_course(course_id))
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
-    
+    return course
+
+async def load_course(course_id: str) -> Optional[Course]:
+    course = await find_one_cached("courses", course_id)
+    if not course:
+        return None
+    counts = await enrollment_counts([course_id])
+    course["enrolled_students"] = course.get("enrolled_students", 0) + counts.get(course_id, 0)
     return Course(**convert_objectid(course))
 
+# Enrollment endpoints
+# enrolled_students is spread over ENROLLMENT_COUNTER_SHARDS counter documents
+# per course so a popular launch doesn't serialize on one hot document. The
+# value stored on the course itself is the imported baseline and is never
+# written on the enrollment path; reads add the shard sum on top of it.
+async def enrollment_counts(course_ids: List[str]) -> Dict[str, int]:
+    if not course_ids:
+        return {}
+    counts = {}
+    async for row in database.course_enrollment_counters.aggregate([
+        {"$match": {"course_id": {"$in": course_ids}}},
+        {"$group": {"_id": "$course_id", "count": {"$sum": "$count"}}},
+    ]):
+        counts[row["_id"]] = row["count"]
+    return counts
+
+async def bump_enrollment_counter(course_id: str, delta: int):
+    shard = random.randrange(ENROLLMENT_COUNTER_SHARDS)
+    await database.course_enrollment_counters.update_one(
+        {"_id": f"{course_id}:{shard}"},
+        {"$inc": {"count": delta}, "$setOnInsert": {"course_id": course_id}},
+        upsert=True
+    )
+
+def enrollment_id(course_id: str, student_id: str) -> str:
+    """Enrollment _id, so invalidation events name the course and student even after a delete."""
+    return f"{course_id}:{student_id}"
+
+def parse_enrollment_id(doc_id: Optional[str]) -> Optional[tuple]:
+    """(course_id, student_id), or None for id-less events and legacy ObjectId enrollments."""
+    if doc_id is None or ":" not in doc_id:
+        return None
+    course_id, student_id = doc_id.split(":", 1)
+    return course_id, student_id
+
+async def resolve_enrolling_student(student_id: Optional[str], current_user: User):
+    """Students enroll themselves; teachers and admins may enroll anyone."""
+    if student_id is None:
+        return str((await find_student_for_user(current_user))["_id"])
+    if current_user.role not in ("teacher", "admin"):
+        raise HTTPException(status_code=403, detail="Only teachers can enroll other students")
+    if not await find_one_cached("students", student_id):
+        raise HTTPException(status_code=404, detail="Student not found")
+    return student_id
+
+@app.post("/courses/{course_id}/enroll", response_model=Enrollment)
+async def enroll_in_course(
+    course_id: str,
+    student_id: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    if not await find_one_cached("courses", course_id):
+        raise HTTPException(status_code=404, detail="Course not found")
+    student_id = await resolve_enrolling_student(student_id, current_user)
+    
+    enrollment = {
+        "_id": enrollment_id(course_id, student_id),
+        "course_id": course_id,
+        "student_id": student_id,
+        "enrolled_at": datetime.utcnow()
+    }
+    try:
+        await database.enrollments.insert_one(enrollment)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Already enrolled in this course")
+    await bump_enrollment_counter(course_id, 1)
+    await record_write("enrollments", enrollment["_id"])
+    activity.record("enrollment", course_id, student_id)
+    
+    return Enrollment(**convert_objectid(enrollment))
+
+@app.delete("/courses/{course_id}/enroll")
+async def unenroll_from_course(
+    course_id: str,
+    student_id: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    student_id = await resolve_enrolling_student(student_id, current_user)
+    result = await database.enrollments.delete_one({"course_id": course_id, "student_id": student_id})
+    if result.deleted_count == 0:
+        raise HTTPException(status_code=404, detail="Enrollment not found")
+    await bump_enrollment_counter(course_id, -1)
+    await record_write("enrollments", enrollment_id(course_id, student_id))
+    
+    return {"message": "Enrollment cancelled"}
+
+@app.get("/courses/{course_id}/students", response_model=List[Student])
+async def get_course_students(
+    course_id: str,
+    skip: int = 0,
+    limit: int = 100,
+    current_user: User = Depends(get_current_user)
+):
+    student_ids = []
+    cursor = database.enrollments.find({"course_id": course_id}, {"student_id": 1}).sort("enrolled_at", 1)
+    async for enrollment in cursor.skip(skip).limit(limit):
+        student_ids.append(ObjectId(enrollment["student_id"]))
+    
+    students = {}
+    async for student in database.students.find({"_id": {"$in": student_ids}}):
+        student_id = student["_id"]
+        students[student_id] = Student(**convert_objectid(student))
+    return [students[student_id] for student_id in student_ids if student_id in students]
+
+@app.get("/students/{student_id}/courses", response_model=List[Course])
+async def get_student_courses(
+    student_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    course_ids = []
+    async for enrollment in database.enrollments.find({"student_id": student_id}, {"course_id": 1}):
+        course_ids.append(enrollment["course_id"])
+    
+    courses = []
+    async for course in database.courses.find({"_id": {"$in": [ObjectId(c) for c in course_ids]}}):
+        courses.append(convert_objectid(course))
+    counts = await enrollment_counts(course_ids)
+    for course in courses:
+        course["enrolled_students"] = course.get("enrolled_students", 0) + counts.get(course["id"], 0)
+    return [Course(**course) for course in courses]
+
 # Assignment endpoints
 @app.get("/assignments", response_model=List[Assignment])
 async def get_assignments(
@@ -384,7 +1624,7 @@ async def get_assignments(
     current_user: User = Depends(get_current_user)
 ):
     assignments = []
-    async for assignment in database.assignments.find().skip(skip).limit(limit):
+    async for assignment in read_database.assignments.find().skip(skip).limit(limit):
         assignment_data = convert_objectid(assignment)
         assignments.append(Assignment(**assignment_data))
     return assignments
@@ -394,6 +1634,8 @@ async def create_assignment(
     assignment: AssignmentCreate,
     current_user: User = Depends(get_current_user)
 ):
+    if assignment.max_score <= 0:
+        raise HTTPException(status_code=400, detail="max_score must be positive")
     assignment_dict = assignment.dict()
     assignment_dict["instructor_id"] = current_user.id
     assignment_dict["created_at"] = datetime.utcnow()
@@ -401,6 +1643,7 @@ async def create_assignment(
     
     result = await database.assignments.insert_one(assignment_dict)
     created_assignment = await database.assignments.find_one({"_id": result.inserted_id})
+    await record_write("assignments", str(result.inserted_id))
     
     return Assignment(**convert_objectid(created_assignment))
 
@@ -409,12 +1652,172 @@ async def get_assignment(
     assignment_id: str,
     current_user: User = Depends(get_current_user)
 ):
-    assignment = await database.assignments.find_one({"_id": ObjectId(assignment_id)})
+    assignment = await find_one_cached("assignments", assignment_id)
     if not assignment:
         raise HTTPException(status_code=404, detail="Assignment not found")
     
     return Assignment(**convert_objectid(assignment))
 
+# Submission endpoints
+async def find_student_for_user(user: User):
+    student = await database.students.find_one({"email": user.email})
+    if not student:
+        raise HTTPException(status_code=404, detail="Student not found")
+    return student
+
+async def apply_score_rollup(student_id: str, score_delta: float, graded_delta: int):
+    """Maintain completed_assignments/average_score from running sums.
+
+    The sums are updated with one atomic $inc; average_score is then set only
+    if the sums are still the ones we produced, so concurrent graders never
+    leave a stale average behind (the last writer's guard always matches).
+    """
+    student = await database.students.find_one_and_update(
+        {"_id": ObjectId(student_id)},
+        {"$inc": {
+            "score_sum": score_delta,
+            "graded_count": graded_delta,
+            "completed_assignments": graded_delta,
+        }},
+        projection={"score_sum": 1, "graded_count": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    if not student:
+        return
+    average = round(student["score_sum"] / student["graded_count"], 2) if student["graded_count"] else 0.0
+    await database.students.update_one(
+        {"_id": student["_id"], "score_sum": student["score_sum"], "graded_count": student["graded_count"]},
+        {"$set": {"average_score": average}}
+    )
+    await record_write("students", student_id)
+
+async def backfill_score_rollups():
+    """Seed running sums for students created before submissions existed."""
+    async for student in database.students.find({"graded_count": {"$exists": False}}):
+        completed = student.get("completed_assignments", 0)
+        await database.students.update_one(
+            {"_id": student["_id"], "graded_count": {"$exists": False}},
+            {"$set": {
+                "score_sum": student.get("average_score", 0.0) * completed,
+                "graded_count": completed
+            }}
+        )
+
+@app.post("/assignments/{assignment_id}/submissions", response_model=Submission)
+async def submit_assignment(
+    assignment_id: str,
+    file: UploadFile = File(None),
+    content: str = Form(None),
+    current_user: User = Depends(get_current_user)
+):
+    assignment = await find_one_cached("assignments", assignment_id)
+    if not assignment:
+        raise HTTPException(status_code=404, detail="Assignment not found")
+    if file is None and not content:
+        raise HTTPException(status_code=400, detail="Submission must include a file or content")
+    
+    student = await find_student_for_user(current_user)
+    
+    file_url = None
+    if file is not None:
+        # Create uploads directory if it doesn't exist
+        upload_dir = Path("uploads/submissions")
+        upload_dir.mkdir(parents=True, exist_ok=True)
+        
+        # Generate unique filename
+        file_extension = file.filename.split(".")[-1]
+        filename = f"{uuid.uuid4()}.{file_extension}"
+        
+        # Save file
+        with open(upload_dir / filename, "wb") as buffer:
+            shutil.copyfileobj(file.file, buffer)
+        file_url = f"/uploads/submissions/{filename}"
+    
+    submission_dict = {
+        "assignment_id": assignment_id,
+        "student_id": str(student["_id"]),
+        "content": content,
+        "file_url": file_url,
+        "status": "submitted",
+        "score": None,
+        "feedback": None,
+        "submitted_at": datetime.utcnow(),
+        "graded_at": None
+    }
+    
+    try:
+        result = await database.submissions.insert_one(submission_dict)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Assignment already submitted")
+    activity.record("submission", assignment_id, str(student["_id"]))
+    
+    submission_dict["_id"] = result.inserted_id
+    return Submission(**convert_objectid(submission_dict))
+
+@app.get("/assignments/{assignment_id}/submissions", response_model=List[Submission])
+async def get_assignment_submissions(
+    assignment_id: str,
+    skip: int = 0,
+    limit: int = 100,
+    current_user: User = Depends(get_current_user)
+):
+    # Teachers see the whole class; students only their own submission
+    query = {"assignment_id": assignment_id}
+    if current_user.role not in ("teacher", "admin"):
+        query["student_id"] = str((await find_student_for_user(current_user))["_id"])
+    
+    submissions = []
+    cursor = database.submissions.find(query).sort("submitted_at", 1)
+    async for submission in cursor.skip(skip).limit(limit):
+        submissions.append(Submission(**convert_objectid(submission)))
+    return submissions
+
+@app.post("/submissions/{submission_id}/grade", response_model=Submission)
+async def grade_submission(
+    submission_id: str,
+    grade: GradeCreate,
+    current_user: User = Depends(get_current_user)
+):
+    if current_user.role not in ("teacher", "admin"):
+        raise HTTPException(status_code=403, detail="Only teachers can grade submissions")
+    
+    submission = await database.submissions.find_one({"_id": ObjectId(submission_id)})
+    if not submission:
+        raise HTTPException(status_code=404, detail="Submission not found")
+    
+    assignment = await find_one_cached("assignments", submission["assignment_id"])
+    max_score = assignment["max_score"] if assignment else 100
+    if max_score <= 0:
+        # Legacy assignments created before max_score was validated can't be scaled
+        raise HTTPException(status_code=409, detail="Assignment has no positive max_score")
+    if grade.score < 0 or grade.score > max_score:
+        raise HTTPException(status_code=400, detail=f"Score must be between 0 and {max_score}")
+    
+    # Swap the score atomically; the previous value tells us whether this
+    # is a first grade or a regrade.
+    previous = await database.submissions.find_one_and_update(
+        {"_id": ObjectId(submission_id)},
+        {"$set": {
+            "score": grade.score,
+            "feedback": grade.feedback,
+            "status": "graded",
+            "graded_at": datetime.utcnow()
+        }},
+        return_document=ReturnDocument.BEFORE,
+    )
+    
+    # Student average_score uses the same 10-point scale as the rest of the app
+    new_points = grade.score / max_score * 10
+    if previous.get("status") == "graded":
+        old_points = previous["score"] / max_score * 10
+        await apply_score_rollup(previous["student_id"], new_points - old_points, 0)
+    else:
+        await apply_score_rollup(previous["student_id"], new_points, 1)
+    
+    activity.record("grading", submission_id, previous["student_id"])
+    graded = await database.submissions.find_one({"_id": ObjectId(submission_id)})
+    return Submission(**convert_objectid(graded))
+
 # Exam endpoints
 @app.get("/exams", response_model=List[Exam])
 async def get_exams(
@@ -423,7 +1826,7 @@ async def get_exams(
     current_user: User = Depends(get_current_user)
 ):
     exams = []
-    async for exam in database.exams.find().skip(skip).limit(limit):
+    async for exam in read_database.exams.find().skip(skip).limit(limit):
         exam_data = convert_objectid(exam)
         exams.append(Exam(**exam_data))
     return exams
@@ -440,19 +1843,445 @@ async def create_exam(
     
     result = await database.exams.insert_one(exam_dict)
     created_exam = await database.exams.find_one({"_id": result.inserted_id})
+    await record_write("exams", str(result.inserted_id))
+    
+    return Exam(**convert_objectid(created_exam))
+
+@app.get("/exams/{exam_id}", response_model=Exam)
+async def get_exam(
+    exam_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    exam = await find_one_cached("exams", exam_id)
+    if not exam:
+        raise HTTPException(status_code=404, detail="Exam not found")
+    
+    return Exam(**convert_objectid(exam))
+
+# Exam session engine
+class AnswerBuffer:
+    """Coalesces autosaved answers in memory and flushes them with bulk_write.
+
+    Repeated saves of the same question between flushes collapse into a
+    single $set, so a burst of autosaves costs one round trip per flush.
+    """
+
+    def __init__(self):
+        self.pending = {}  # session_id -> {question: answer}
+        self.pending_answers = 0  # total answers across pending, kept in step with it
+        self.saved_at = {}  # session_id -> time of the latest buffered save
+        self.inflight = {}  # session_id -> future resolved when its flush finishes
+        self.sessions = {}  # session_id -> {"email", "exam_id", "deadline", "status"}
+        self.stats = {"saves": 0, "flushes": 0, "flushed_sessions": 0, "rejected_after_submit": 0}
+
+    def add(self, session_id: str, answers: Dict[str, str]):
+        buffered = self.pending.setdefault(session_id, {})
+        before = len(buffered)
+        buffered.update(answers)
+        self.pending_answers += len(buffered) - before
+        self.saved_at[session_id] = datetime.utcnow()
+        self.stats["saves"] += 1
+
+    def requeue(self, batch: dict, saved_at: dict):
+        # Put answers back without clobbering answers saved meanwhile
+        for session_id, answers in batch.items():
+            before = len(self.pending.get(session_id, {}))
+            self.pending[session_id] = {**answers, **self.pending.get(session_id, {})}
+            self.pending_answers += len(self.pending[session_id]) - before
+            self.saved_at[session_id] = max(saved_at[session_id], self.saved_at.get(session_id, saved_at[session_id]))
+
+    async def flush(self, session_ids=None):
+        if session_ids is None:
+            batch, self.pending = self.pending, {}
+        else:
+            batch = {sid: self.pending.pop(sid) for sid in session_ids if sid in self.pending}
+        if not batch:
+            return
+        self.pending_answers -= sum(len(answers) for answers in batch.values())
+        saved_at = {sid: self.saved_at.pop(sid) for sid in batch}
+        # Answers saved on any worker before the session was submitted still
+        # count, so the write is allowed until submitted_at passes the save
+        session_order = list(batch)
+        operations = [
+            UpdateOne(
+                {"_id": ObjectId(session_id), "$or": [
+                    {"status": "in_progress"}, {"submitted_at": {"$gte": saved_at[session_id]}}
+                ]},
+                {"$set": {f"answers.{question}": answer for question, answer in batch[session_id].items()}}
+            )
+            for session_id in session_order
+        ]
+        done = asyncio.get_running_loop().create_future()
+        for session_id in session_order:
+            self.inflight[session_id] = done
+        try:
+            result = await database.exam_sessions.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            failed = {session_order[error["index"]] for error in e.details.get("writeErrors", [])}
+            self.requeue({sid: batch[sid] for sid in failed}, saved_at)
+            raise
+        except PyMongoError:
+            self.requeue(batch, saved_at)
+            raise
+        finally:
+            for session_id in session_order:
+                if self.inflight.get(session_id) is done:
+                    del self.inflight[session_id]
+            done.set_result(None)
+        if result.matched_count < len(operations):
+            await self.forget_submitted(session_order)
+        self.stats["flushes"] += 1
+        self.stats["flushed_sessions"] += len(operations)
+
+    async def forget_submitted(self, session_ids):
+        """Drop cached meta for sessions submitted elsewhere so later saves get a 409."""
+        async for session in database.exam_sessions.find(
+            {"_id": {"$in": [ObjectId(sid) for sid in session_ids]}, "status": {"$ne": "in_progress"}}, {"_id": 1}
+        ):
+            self.sessions.pop(str(session["_id"]), None)
+            self.stats["rejected_after_submit"] += 1
+
+    async def settle(self, session_id: str):
+        """Return once every answer buffered here for session_id is written."""
+        while True:
+            inflight = self.inflight.get(session_id)
+            if inflight is not None:
+                await asyncio.shield(inflight)
+            elif session_id in self.pending:
+                await self.flush([session_id])
+            else:
+                return
+
+answer_buffer = AnswerBuffer()
+
+def session_response(session: dict) -> ExamSession:
+    session = convert_objectid(session)
+    pending = answer_buffer.pending.get(session["id"])
+    if pending:
+        session["answers"] = {**session.get("answers", {}), **pending}
+    remaining = (session["deadline"] - datetime.utcnow()).total_seconds()
+    session["remaining_seconds"] = max(0, int(remaining)) if session["status"] == "in_progress" else 0
+    return ExamSession(**session)
+
+async def get_session_meta(session_id: str, current_user: User):
+    """Session ownership and deadline, kept in memory so autosaves skip a read."""
+    meta = answer_buffer.sessions.get(session_id)
+    if meta is None:
+        session = await database.exam_sessions.find_one(
+            {"_id": ObjectId(session_id)}, {"student_email": 1, "exam_id": 1, "deadline": 1, "status": 1}
+        )
+        if not session:
+            raise HTTPException(status_code=404, detail="Exam session not found")
+        meta = {
+            "email": session["student_email"],
+            "exam_id": session["exam_id"],
+            "deadline": session["deadline"],
+            "status": session["status"]
+        }
+        if meta["status"] == "in_progress":
+            answer_buffer.sessions[session_id] = meta
+    if meta["email"] != current_user.email:
+        raise HTTPException(status_code=403, detail="Not your exam session")
+    return meta
+
+async def expire_exam_sessions():
+    """Auto-submit sessions whose deadline (plus grace) has passed."""
+    cutoff = datetime.utcnow() - timedelta(seconds=EXAM_SUBMIT_GRACE_SECONDS)
+    expired = [sid for sid, meta in answer_buffer.sessions.items() if meta["deadline"] < cutoff]
+    await answer_buffer.flush(expired)
+    for session_id in expired:
+        answer_buffer.sessions.pop(session_id, None)
+    await database.exam_sessions.update_many(
+        {"status": "in_progress", "deadline": {"$lt": cutoff}},
+        {"$set": {"status": "submitted", "submitted_at": datetime.utcnow(), "auto_submitted": True}}
+    )
+
+async def run_answer_flusher():
+    last_expiry = time.monotonic()
+    while True:
+        await asyncio.sleep(ANSWER_FLUSH_SECONDS)
+        try:
+            await answer_buffer.flush()
+            if time.monotonic() - last_expiry > EXAM_SUBMIT_GRACE_SECONDS:
+                await expire_exam_sessions()
+                last_expiry = time.monotonic()
+        except PyMongoError as e:
+            logger.warning("Answer flush failed: %s", e)
+
+@app.post("/exams/{exam_id}/start", response_model=ExamSession)
+async def start_exam(
+    exam_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    exam = await find_one_cached("exams", exam_id)
+    if not exam:
+        raise HTTPException(status_code=404, detail="Exam not found")
+    
+    now = datetime.utcnow()
+    if now < exam["exam_date"]:
+        raise HTTPException(status_code=400, detail="Exam has not opened yet")
+    duration = timedelta(minutes=exam["duration_minutes"])
+    closes_at = exam["exam_date"] + duration
+    
+    student = await find_student_for_user(current_user)
+    
+    # Idempotent start: a retry or a second tab returns the existing session
+    session_key = {"exam_id": exam_id, "student_id": str(student["_id"])}
+    if now >= closes_at or exam.get("status") == "completed":
+        session = await database.exam_sessions.find_one(session_key)
+        if session is None:
+            raise HTTPException(status_code=409, detail="Exam has already closed")
+        return session_response(session)
+    try:
+        session = await database.exam_sessions.find_one_and_update(
+            session_key,
+            {"$setOnInsert": {
+                "student_email": current_user.email,
+                "status": "in_progress",
+                "answers": {},
+                "started_at": now,
+                # Late starters get only what is left of the exam window
+                "deadline": min(now + duration, closes_at),
+                "submitted_at": None,
+                "auto_submitted": False
+            }},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+    except DuplicateKeyError:
+        # Two concurrent starts raced on the upsert; the other one won
+        session = await database.exam_sessions.find_one(session_key)
+    return session_response(session)
+
+@app.get("/exam-sessions/{session_id}", response_model=ExamSession)
+async def get_exam_session(
+    session_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    await get_session_meta(session_id, current_user)
+    session = await database.exam_sessions.find_one({"_id": ObjectId(session_id)})
+    return session_response(session)
+
+@app.put("/exam-sessions/{session_id}/answers")
+async def save_exam_answers(
+    session_id: str,
+    batch: AnswerBatch,
+    current_user: User = Depends(get_current_user)
+):
+    meta = await get_session_meta(session_id, current_user)
+    if meta["status"] != "in_progress":
+        raise HTTPException(status_code=409, detail="Exam session already submitted")
+    if datetime.utcnow() > meta["deadline"] + timedelta(seconds=EXAM_SUBMIT_GRACE_SECONDS):
+        raise HTTPException(status_code=409, detail="Exam time is over")
+    # Keys become "answers.<key>" paths, so only canonical question indexes are allowed
+    exam = await find_one_cached("exams", meta["exam_id"])
+    question_count = (exam or {}).get("total_questions") or EXAM_MAX_QUESTIONS
+    for question in batch.answers:
+        if not (question.isdigit() and str(int(question)) == question and int(question) < question_count):
+            raise HTTPException(status_code=400, detail=f"Invalid question index: {question!r}")
+    
+    answer_buffer.add(session_id, batch.answers)
+    if answer_buffer.pending_answers >= ANSWER_FLUSH_MAX_PENDING:
+        await answer_buffer.flush()
+    
+    return {"saved": len(batch.answers)}
+
+@app.post("/exam-sessions/{session_id}/submit", response_model=ExamSession)
+async def submit_exam(
+    session_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    meta = await get_session_meta(session_id, current_user)
+    # Includes a flush already in flight, whose answers must land first
+    await answer_buffer.settle(session_id)
+    
+    now = datetime.utcnow()
+    session = await database.exam_sessions.find_one_and_update(
+        {"_id": ObjectId(session_id), "status": "in_progress"},
+        {"$set": {
+            "status": "submitted",
+            "submitted_at": now,
+            "auto_submitted": now > meta["deadline"] + timedelta(seconds=EXAM_SUBMIT_GRACE_SECONDS)
+        }},
+        return_document=ReturnDocument.AFTER,
+    )
+    answer_buffer.sessions.pop(session_id, None)
+    if not session:
+        raise HTTPException(status_code=409, detail="Exam session already submitted")
+    activity.record("exam_submission", session["exam_id"], session["student_id"])
+    
+    return session_response(session)
+
+# Batch exam grading
+def parse_numeric(values: np.ndarray) -> np.ndarray:
+    """Parse an object matrix of strings to floats; blanks and junk become NaN."""
+    try:
+        return np.where(values == "", "nan", values).astype(float)
+    except ValueError:
+        def to_float(value):
+            try:
+                return float(value)
+            except ValueError:
+                return np.nan
+        return np.vectorize(to_float, otypes=[float])(values)
+
+@lru_cache(maxsize=32)
+def question_keys(question_count: int):
+    return [str(i) for i in range(question_count)], [""] * question_count
+
+def response_row(answers: Dict[str, str], question_count: int) -> List[str]:
+    """Flatten a session's answers dict to one row, blanks for skipped questions."""
+    keys, blanks = question_keys(question_count)
+    return list(map(answers.get, keys, blanks))
+
+def score_exam_batch(key: dict, rows: List[List[str]]):
+    """Score a whole cohort in one vectorized pass.
+
+    `rows` holds one response_row() per submission. Returns (scores, correct_counts, question_stats) where scores are scaled
+    to the exam max_score and question_stats holds per-question difficulty
+    (share answering correctly) and discrimination (correlation of the item
+    with the rest-of-test score).
+    """
+    question_count = len(key["answers"])
+    numeric = np.array([t == "numeric" for t in (key.get("types") or ["choice"] * question_count)], dtype=bool)
+    choice = ~numeric
+    points = np.asarray(key.get("points") or [1.0] * question_count, dtype=float)
+    tolerance = np.asarray(key.get("tolerance") or [0.0] * question_count, dtype=float)
+    answers = np.array([answer.strip().upper() for answer in key["answers"]], dtype=object)
+
+    grid = np.array(rows, dtype=object).reshape(len(rows), question_count)
+
+    correct = np.zeros(grid.shape, dtype=bool)
+    choice_grid = grid[:, choice]
+    choice_answers = answers[choice]
+    matched = (choice_grid == choice_answers).astype(bool)
+    # Only answers that missed an exact match need case/whitespace folding
+    # (folded once per distinct string, cohorts reuse a handful of values)
+    miss_rows, miss_cols = np.nonzero(~matched & (choice_grid != ""))
+    if len(miss_rows):
+        values = choice_grid[miss_rows, miss_cols].tolist()
+        folding = {value: str(value).strip().upper() for value in set(values)}
+        folded = np.array(list(map(folding.__getitem__, values)), dtype=object)
+        matched[miss_rows, miss_cols] = (folded == choice_answers[miss_cols]).astype(bool)
+    correct[:, choice] = matched
+    if numeric.any():
+        given = parse_numeric(grid[:, numeric])
+        expected = parse_numeric(answers[numeric])
+        # NaN compares False, so blank or unparsable answers score zero
+        correct[:, numeric] = np.abs(given - expected) <= tolerance[numeric]
+
+    earned = correct.astype(float) * points
+    totals = earned.sum(axis=1)
+    scores = totals / points.sum() * key.get("max_score", 100)
+
+    difficulty = correct.mean(axis=0) if len(rows) else np.zeros(question_count)
+    rest = totals[:, None] - earned
+    item_centered = correct - difficulty
+    rest_centered = rest - rest.mean(axis=0) if len(rows) else rest
+    denominator = np.sqrt((item_centered ** 2).sum(axis=0) * (rest_centered ** 2).sum(axis=0))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        discrimination = np.where(
+            denominator > 0, (item_centered * rest_centered).sum(axis=0) / denominator, 0.0
+        )
+
+    question_stats = [
+        {"question": i, "difficulty": round(float(difficulty[i]), 4),
+         "discrimination": round(float(discrimination[i]), 4)}
+        for i in range(question_count)
+    ]
+    return scores, correct.sum(axis=1), question_stats
+
+def answer_key_problem(key: dict) -> Optional[str]:
+    """Why a key can't be scored, or None. Empty or zero-point keys divide by zero."""
+    if not key.get("answers"):
+        return "answers must not be empty"
+    for field in ("types", "points", "tolerance"):
+        values = key.get(field)
+        if values is not None and len(values) != len(key["answers"]):
+            return f"{field} must have one entry per answer"
+    if any(t not in ("choice", "numeric") for t in key.get("types") or []):
+        return "types must be 'choice' or 'numeric'"
+    points = key.get("points")
+    if points is not None and (any(p < 0 for p in points) or sum(points) <= 0):
+        return "points must be non-negative and add up to more than 0"
+    return None
+
+@app.put("/exams/{exam_id}/answer-key")
+async def set_exam_answer_key(
+    exam_id: str,
+    key: AnswerKeyCreate,
+    current_user: User = Depends(get_current_user)
+):
+    if current_user.role not in ("teacher", "admin"):
+        raise HTTPException(status_code=403, detail="Only teachers can set answer keys")
+    exam = await find_one_cached("exams", exam_id)
+    if not exam:
+        raise HTTPException(status_code=404, detail="Exam not found")
+    problem = answer_key_problem(key.dict())
+    if problem:
+        raise HTTPException(status_code=400, detail=problem)
     
-    return Exam(**convert_objectid(created_exam))
+    # Kept out of the exam document so it never leaks through GET /exams
+    await database.exam_answer_keys.update_one(
+        {"_id": exam_id},
+        {"$set": {**key.dict(), "updated_at": datetime.utcnow()}},
+        upsert=True
+    )
+    return {"message": "Answer key saved", "questions": len(key.answers)}
 
-@app.get("/exams/{exam_id}", response_model=Exam)
-async def get_exam(
+@app.post("/exams/{exam_id}/grade")
+async def grade_exam(
     exam_id: str,
     current_user: User = Depends(get_current_user)
 ):
-    exam = await database.exams.find_one({"_id": ObjectId(exam_id)})
+    if current_user.role not in ("teacher", "admin"):
+        raise HTTPException(status_code=403, detail="Only teachers can grade exams")
+    exam = await find_one_cached("exams", exam_id)
     if not exam:
         raise HTTPException(status_code=404, detail="Exam not found")
+    key = await database.exam_answer_keys.find_one({"_id": exam_id})
+    if not key:
+        raise HTTPException(status_code=400, detail="Exam has no answer key")
+    problem = answer_key_problem(key)
+    if problem:
+        raise HTTPException(status_code=400, detail=f"Invalid answer key: {problem}")
+    key["max_score"] = exam["max_score"]
     
-    return Exam(**convert_objectid(exam))
+    # Rows are flattened while the cursor streams, overlapping the fetch
+    question_count = len(key["answers"])
+    session_ids = []
+    rows = []
+    async for session in database.exam_sessions.find(
+        {"exam_id": exam_id, "status": "submitted"}, {"answers": 1}
+    ).batch_size(1000):
+        session_ids.append(session["_id"])
+        rows.append(response_row(session.get("answers", {}), question_count))
+    if not rows:
+        return {"graded": 0, "question_stats": []}
+    
+    # Keep the scoring pass off the event loop
+    scores, correct_counts, question_stats = await asyncio.to_thread(score_exam_batch, key, rows)
+    
+    graded_at = datetime.utcnow()
+    operations = [
+        UpdateOne(
+            {"_id": session_id},
+            {"$set": {"score": round(float(score), 2), "correct_count": int(count), "graded_at": graded_at}}
+        )
+        for session_id, score, count in zip(session_ids, scores, correct_counts)
+    ]
+    for start in range(0, len(operations), 1000):
+        await database.exam_sessions.bulk_write(operations[start:start + 1000], ordered=False)
+    await database.exam_answer_keys.update_one(
+        {"_id": exam_id},
+        {"$set": {"question_stats": question_stats, "graded_at": graded_at}}
+    )
+    
+    return {
+        "graded": len(operations),
+        "mean_score": round(float(scores.mean()), 2),
+        "question_stats": question_stats
+    }
 
 # Webinar endpoints
 @app.get("/webinars", response_model=List[Webinar])
@@ -461,8 +2290,11 @@ async def get_webinars(
     limit: int = 100,
     current_user: User = Depends(get_current_user)
 ):
+    return await single_flight.do(("webinars", skip, limit), lambda: load_webinars(skip, limit))
+
+async def load_webinars(skip: int, limit: int) -> List[Webinar]:
     webinars = []
-    async for webinar in database.webinars.find().skip(skip).limit(limit):
+    async for webinar in read_database.webinars.find().skip(skip).limit(limit):
         webinar_data = convert_objectid(webinar)
         webinars.append(Webinar(**webinar_data))
     return webinars
@@ -480,6 +2312,7 @@ async def create_webinar(
     
     result = await database.webinars.insert_one(webinar_dict)
     created_webinar = await database.webinars.find_one({"_id": result.inserted_id})
+    await record_write("webinars", str(result.inserted_id))
     
     return Webinar(**convert_objectid(created_webinar))
 
@@ -488,12 +2321,123 @@ async def get_webinar(
     webinar_id: str,
     current_user: User = Depends(get_current_user)
 ):
-    webinar = await database.webinars.find_one({"_id": ObjectId(webinar_id)})
+    webinar = await find_one_cached("webinars", webinar_id)
     if not webinar:
         raise HTTPException(status_code=404, detail="Webinar not found")
     
     return Webinar(**convert_objectid(webinar))
 
+# Webinar registration endpoints
+# A seat is only taken when registered_count < max_participants holds at
+# update time, so concurrent registrations can never oversell.
+SEAT_AVAILABLE = {"$or": [
+    {"max_participants": None},
+    {"$expr": {"$lt": ["$registered_count", "$max_participants"]}},
+]}
+
+async def claim_webinar_seat(webinar_id: str) -> bool:
+    webinar = await database.webinars.find_one_and_update(
+        {"_id": ObjectId(webinar_id), **SEAT_AVAILABLE},
+        {"$inc": {"registered_count": 1}},
+        projection={"_id": 1},
+    )
+    return webinar is not None
+
+async def release_webinar_seat(webinar_id: str):
+    await database.webinars.update_one(
+        {"_id": ObjectId(webinar_id), "registered_count": {"$gt": 0}},
+        {"$inc": {"registered_count": -1}}
+    )
+
+async def promote_from_waitlist(webinar_id: str):
+    """Hand a freed seat to the earliest waitlisted registration, if any."""
+    if not await claim_webinar_seat(webinar_id):
+        return
+    promoted = await database.webinar_registrations.find_one_and_update(
+        {"webinar_id": webinar_id, "status": "waitlisted"},
+        {"$set": {"status": "registered", "promoted_at": datetime.utcnow()}},
+        sort=[("registered_at", 1)],
+    )
+    if promoted is None:
+        await release_webinar_seat(webinar_id)
+
+@app.post("/webinars/{webinar_id}/register", response_model=WebinarRegistration)
+async def register_for_webinar(
+    webinar_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    webinar = await find_one_cached("webinars", webinar_id)
+    if not webinar:
+        raise HTTPException(status_code=404, detail="Webinar not found")
+    if webinar.get("status") == "completed":
+        raise HTTPException(status_code=400, detail="Webinar has already ended")
+    
+    # The unique (webinar_id, user_id) index makes double registration fail fast
+    registration = {
+        "webinar_id": webinar_id,
+        "user_id": current_user.id,
+        "user_name": current_user.full_name,
+        "status": "pending",
+        "registered_at": datetime.utcnow()
+    }
+    try:
+        result = await database.webinar_registrations.insert_one(registration)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Already registered for this webinar")
+    activity.record("webinar_registration", webinar_id, current_user.id)
+    
+    registration["status"] = "registered" if await claim_webinar_seat(webinar_id) else "waitlisted"
+    await database.webinar_registrations.update_one(
+        {"_id": result.inserted_id},
+        {"$set": {"status": registration["status"]}}
+    )
+    if registration["status"] == "waitlisted":
+        # A seat freed while we were pending would otherwise go unclaimed
+        await promote_from_waitlist(webinar_id)
+        refreshed = await database.webinar_registrations.find_one({"_id": result.inserted_id})
+        registration["status"] = refreshed["status"]
+    # registered_count is a counter: drop our cached copy, other workers catch up by TTL
+    publish_invalidation("webinars", webinar_id, {"registered_count"})
+    
+    registration["_id"] = result.inserted_id
+    return WebinarRegistration(**convert_objectid(registration))
+
+@app.delete("/webinars/{webinar_id}/register")
+async def unregister_from_webinar(
+    webinar_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    registration = await database.webinar_registrations.find_one_and_delete(
+        {"webinar_id": webinar_id, "user_id": current_user.id}
+    )
+    if not registration:
+        raise HTTPException(status_code=404, detail="Registration not found")
+    
+    if registration["status"] == "registered":
+        await release_webinar_seat(webinar_id)
+        await promote_from_waitlist(webinar_id)
+    publish_invalidation("webinars", webinar_id, {"registered_count"})
+    
+    return {"message": "Registration cancelled"}
+
+@app.get("/webinars/{webinar_id}/registrations", response_model=List[WebinarRegistration])
+async def get_webinar_registrations(
+    webinar_id: str,
+    status: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 100,
+    current_user: User = Depends(get_current_user)
+):
+    query = {"webinar_id": webinar_id}
+    if status:
+        query["status"] = status
+    
+    registrations = []
+    cursor = database.webinar_registrations.find(query).sort("registered_at", 1)
+    async for registration in cursor.skip(skip).limit(limit):
+        registrations.append(WebinarRegistration(**convert_objectid(registration)))
+    return registrations
+
 # Student endpoints
 @app.get("/students", response_model=List[Student])
 async def get_students(
@@ -502,7 +2446,7 @@ async def get_students(
     current_user: User = Depends(get_current_user)
 ):
     students = []
-    async for student in database.students.find().skip(skip).limit(limit):
+    async for student in read_database.students.find().skip(skip).limit(limit):
         student_data = convert_objectid(student)
         students.append(Student(**student_data))
     return students
@@ -518,9 +2462,13 @@ async def create_student(
     student_dict["progress"] = 0
     student_dict["completed_assignments"] = 0
     student_dict["average_score"] = 0.0
+    student_dict["score_sum"] = 0.0
+    student_dict["graded_count"] = 0
     
     result = await database.students.insert_one(student_dict)
     created_student = await database.students.find_one({"_id": result.inserted_id})
+    await record_write("students", str(result.inserted_id))
+    index_for_autocomplete("students", created_student)
     
     return Student(**convert_objectid(created_student))
 
@@ -529,26 +2477,142 @@ async def get_student(
     student_id: str,
     current_user: User = Depends(get_current_user)
 ):
-    student = await database.students.find_one({"_id": ObjectId(student_id)})
+    student = await find_one_cached("students", student_id)
     if not student:
         raise HTTPException(status_code=404, detail="Student not found")
     
     return Student(**convert_objectid(student))
 
+# Unique viewer sketches
+class HyperLogLog:
+    """HyperLogLog sketch over 64-bit hashes, registers stored as bytes."""
+
+    def __init__(self, registers: Optional[bytes] = None, precision: int = HLL_PRECISION):
+        self.precision = precision
+        self.size = 1 << precision
+        if registers:
+            self.registers = np.frombuffer(registers, dtype=np.uint8).copy()
+        else:
+            self.registers = np.zeros(self.size, dtype=np.uint8)
+
+    @staticmethod
+    def hash(value: str) -> int:
+        return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+    def add_hashes(self, hashes: List[int]):
+        rest_bits = 64 - self.precision
+        mask = (1 << rest_bits) - 1
+        index = np.array([h >> rest_bits for h in hashes], dtype=np.int64)
+        # rank = leading zeros in the remaining bits + 1
+        rank = np.array([rest_bits - (h & mask).bit_length() + 1 for h in hashes], dtype=np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def estimate(self) -> int:
+        m = self.size
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.power(2.0, -self.registers.astype(np.float64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            return int(round(m * math.log(m / zeros)))  # linear counting for small sets
+        return int(round(raw))
+
+    def to_bytes(self) -> bytes:
+        return self.registers.tobytes()
+
+class ViewerSketchBuffer:
+    """Buffers viewer hashes per document and merges them into stored sketches.
+
+    Merging a sketch is idempotent, so a flush that loses the optimistic
+    version check simply retries those viewers on the next round.
+    """
+
+    def __init__(self):
+        self.pending = {}  # (collection, doc_id) -> set of viewer hashes
+        self.stats = {"flushes": 0, "documents_updated": 0, "conflicts": 0}
+
+    def record(self, collection: str, doc_id: str, viewer_id: str):
+        self.pending.setdefault((collection, doc_id), set()).add(HyperLogLog.hash(viewer_id))
+
+    async def flush(self):
+        batch, self.pending = self.pending, {}
+        by_collection = {}
+        for (collection, doc_id), hashes in batch.items():
+            by_collection.setdefault(collection, {})[ObjectId(doc_id)] = hashes
+        
+        unflushed = list(by_collection)
+        for collection, docs in by_collection.items():
+            try:
+                written, result = await self.merge(collection, docs)
+            except PyMongoError:
+                # Put back this collection and the ones not reached yet
+                for pending_collection in unflushed:
+                    self.requeue(pending_collection, by_collection[pending_collection])
+                raise
+            unflushed.remove(collection)
+            if not written:
+                continue
+            self.stats["documents_updated"] += result.modified_count
+            if result.matched_count < written:
+                # Requeue the whole collection batch; re-adding viewers is harmless
+                self.stats["conflicts"] += written - result.matched_count
+                self.requeue(collection, docs)
+        self.stats["flushes"] += 1
+
+    def requeue(self, collection: str, docs: dict):
+        for doc_id, hashes in docs.items():
+            self.pending.setdefault((collection, str(doc_id)), set()).update(hashes)
+
+    async def merge(self, collection: str, docs: dict):
+        operations = []
+        async for doc in database[collection].find(
+            {"_id": {"$in": list(docs)}}, {"viewer_hll": 1, "viewer_hll_version": 1}
+        ):
+            sketch = HyperLogLog(doc.get("viewer_hll"))
+            sketch.add_hashes(list(docs[doc["_id"]]))
+            version = doc.get("viewer_hll_version", 0)
+            operations.append(UpdateOne(
+                {"_id": doc["_id"], "viewer_hll_version": doc.get("viewer_hll_version")},
+                {"$set": {
+                    "viewer_hll": Binary(sketch.to_bytes()),
+                    "viewer_hll_version": version + 1,
+                    "unique_viewers": sketch.estimate()
+                }}
+            ))
+        if not operations:
+            return 0, None
+        return len(operations), await database[collection].bulk_write(operations, ordered=False)
+
+viewer_sketches = ViewerSketchBuffer()
+
+async def run_viewer_sketch_flusher():
+    while True:
+        await asyncio.sleep(VIEWER_SKETCH_FLUSH_SECONDS)
+        try:
+            await viewer_sketches.flush()
+        except PyMongoError as e:
+            logger.warning("Viewer sketch flush failed: %s", e)
+
 # Library endpoints
 @app.get("/library", response_model=List[LibraryDocument])
 async def get_library_documents(
+    request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     category: Optional[str] = None,
     current_user: User = Depends(get_current_user)
 ):
+    etag = await collection_etag("library", skip, limit, category)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    
     query = {}
     if category:
         query["category"] = category
     
     documents = []
-    async for doc in database.library.find(query).skip(skip).limit(limit):
+    async for doc in database.library.find(query, SKETCH_PROJECTION).skip(skip).limit(limit):
         doc_data = convert_objectid(doc)
         documents.append(LibraryDocument(**doc_data))
     return documents
@@ -568,7 +2632,10 @@ async def create_library_document(
     doc_dict["downloads"] = 0
     
     result = await database.library.insert_one(doc_dict)
+    activity.record("library_upload", str(result.inserted_id), current_user.id)
     created_doc = await database.library.find_one({"_id": result.inserted_id})
+    await record_write("library", str(result.inserted_id))
+    index_for_autocomplete("library", created_doc)
     
     return LibraryDocument(**convert_objectid(created_doc))
 
@@ -613,16 +2680,31 @@ async def upload_document(
     }
     
     result = await database.library.insert_one(doc_dict)
+    activity.record("library_upload", str(result.inserted_id), current_user.id)
     created_doc = await database.library.find_one({"_id": result.inserted_id})
+    await record_write("library", str(result.inserted_id))
+    index_for_autocomplete("library", created_doc)
     
     return LibraryDocument(**convert_objectid(created_doc))
 
 @app.get("/library/{document_id}", response_model=LibraryDocument)
 async def get_library_document(
     document_id: str,
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_user)
 ):
-    document = await database.library.find_one({"_id": ObjectId(document_id)})
+    etag = await collection_etag("library", document_id)
+    if etag_matches(request, etag):
+        # Still count the view even though the body is not re-sent
+        await database.library.update_one(
+            {"_id": ObjectId(document_id)},
+            {"$inc": {"views": 1}}
+        )
+        viewer_sketches.record("library", document_id, current_user.id)
+        return not_modified(etag)
+    
+    document = await database.library.find_one({"_id": ObjectId(document_id)}, SKETCH_PROJECTION)
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
     
@@ -631,23 +2713,116 @@ async def get_library_document(
         {"_id": ObjectId(document_id)},
         {"$inc": {"views": 1}}
     )
+    viewer_sketches.record("library", document_id, current_user.id)
+    response.headers["ETag"] = etag
     
     return LibraryDocument(**convert_objectid(document))
 
+# Forum hot ranking
+# Every view or reply adds weight * 2^(hours since HOT_SCORE_EPOCH / half-life)
+# to a topic. All topics decay at the same rate, so ordering by the stored
+# sum equals ordering by the decayed value and old scores never need
+# rescoring. The sum is kept in log space so it cannot overflow.
+HOT_WEIGHTS = {"views": 1.0, "replies": 5.0}
+
+def hot_term(weight: float, at: datetime) -> float:
+    hours = (at - HOT_SCORE_EPOCH).total_seconds() / 3600
+    return math.log(weight) + hours / HOT_SCORE_HALF_LIFE_HOURS * math.log(2)
+
+def add_hot_term(term: float):
+    """Update pipeline computing hot_score = log(exp(hot_score) + exp(term)) atomically."""
+    current = {"$ifNull": ["$hot_score", -1e9]}
+    high = {"$max": [current, term]}
+    low = {"$min": [current, term]}
+    return [{"$set": {"hot_score": {
+        "$add": [high, {"$ln": {"$add": [1, {"$exp": {"$subtract": [low, high]}}]}}]
+    }}}]
+
+class ForumActivityBuffer:
+    """Collects views/replies per topic and folds them into hot_score in batches."""
+
+    def __init__(self):
+        self.pending = {}  # topic_id -> {"views": n, "replies": n}
+        self.stats = {"flushes": 0, "topics_updated": 0}
+
+    def record(self, topic_id: str, kind: str):
+        counts = self.pending.setdefault(topic_id, {"views": 0, "replies": 0})
+        counts[kind] += 1
+
+    async def flush(self):
+        batch, self.pending = self.pending, {}
+        if not batch:
+            return
+        now = datetime.utcnow()
+        operations = []
+        for topic_id, counts in batch.items():
+            weight = sum(HOT_WEIGHTS[kind] * n for kind, n in counts.items())
+            operations.append(UpdateOne({"_id": ObjectId(topic_id)}, add_hot_term(hot_term(weight, now))))
+        # Server-side pipeline updates, so workers flushing the same topic never race
+        try:
+            result = await database.forum.bulk_write(operations, ordered=False)
+        except PyMongoError:
+            for topic_id, counts in batch.items():
+                for kind, n in counts.items():
+                    self.pending.setdefault(topic_id, {"views": 0, "replies": 0})[kind] += n
+            raise
+        self.stats["flushes"] += 1
+        self.stats["topics_updated"] += result.modified_count
+        # Only the hot ordering moved, so bump its own counter rather than the
+        # forum version, which would reset every /forum and /forum/{id} ETag
+        await database.collection_versions.update_one(
+            {"_id": "forum_hot"}, {"$inc": {"version": 1}}, upsert=True
+        )
+
+forum_activity = ForumActivityBuffer()
+
+async def run_forum_activity_flusher():
+    while True:
+        await asyncio.sleep(HOT_SCORE_FLUSH_SECONDS)
+        try:
+            await forum_activity.flush()
+        except PyMongoError as e:
+            logger.warning("Forum activity flush failed: %s", e)
+
+async def backfill_hot_scores():
+    """Give topics created before hot ranking a score from their counters."""
+    async for topic in database.forum.find({"hot_score": {"$exists": False}}):
+        created_at = topic.get("created_at", HOT_SCORE_EPOCH)
+        weight = 1 + topic.get("views", 0) * HOT_WEIGHTS["views"] + topic.get("replies", 0) * HOT_WEIGHTS["replies"]
+        await database.forum.update_one(
+            {"_id": topic["_id"], "hot_score": {"$exists": False}},
+            {"$set": {"hot_score": hot_term(weight, created_at)}}
+        )
+
 # Forum endpoints
 @app.get("/forum", response_model=List[ForumTopic])
 async def get_forum_topics(
+    request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     category: Optional[str] = None,
+    sort: Optional[str] = None,
     current_user: User = Depends(get_current_user)
 ):
+    etag = await collection_etag(
+        "forum", skip, limit, category, sort, depends_on=("forum_hot",) if sort == "hot" else ()
+    )
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    
     query = {}
     if category:
         query["category"] = category
     
+    cursor = database.forum.find(query, SKETCH_PROJECTION)
+    if sort == "hot":
+        # Served straight from the (is_pinned, hot_score) / (category, ...) indexes
+        cursor = cursor.sort([("is_pinned", -1), ("hot_score", -1)])
+    
     topics = []
-    async for topic in database.forum.find(query).skip(skip).limit(limit):
+    async for topic in cursor.skip(skip).limit(limit):
         topic_data = convert_objectid(topic)
         topics.append(ForumTopic(**topic_data))
     return topics
@@ -664,18 +2839,35 @@ async def create_forum_topic(
     topic_dict["created_at"] = datetime.utcnow()
     topic_dict["views"] = 0
     topic_dict["replies"] = 0
+    topic_dict["last_activity_at"] = topic_dict["created_at"]
+    topic_dict["hot_score"] = hot_term(1.0, topic_dict["created_at"])
     
     result = await database.forum.insert_one(topic_dict)
+    activity.record("forum_topic", str(result.inserted_id), current_user.id)
     created_topic = await database.forum.find_one({"_id": result.inserted_id})
+    await record_write("forum", str(result.inserted_id))
     
     return ForumTopic(**convert_objectid(created_topic))
 
 @app.get("/forum/{topic_id}", response_model=ForumTopic)
 async def get_forum_topic(
     topic_id: str,
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_user)
 ):
-    topic = await database.forum.find_one({"_id": ObjectId(topic_id)})
+    etag = await collection_etag("forum", topic_id)
+    if etag_matches(request, etag):
+        # Still count the view even though the body is not re-sent
+        await database.forum.update_one(
+            {"_id": ObjectId(topic_id)},
+            {"$inc": {"views": 1}}
+        )
+        viewer_sketches.record("forum", topic_id, current_user.id)
+        forum_activity.record(topic_id, "views")
+        return not_modified(etag)
+    
+    topic = await database.forum.find_one({"_id": ObjectId(topic_id)}, SKETCH_PROJECTION)
     if not topic:
         raise HTTPException(status_code=404, detail="Topic not found")
     
@@ -684,20 +2876,102 @@ async def get_forum_topic(
         {"_id": ObjectId(topic_id)},
         {"$inc": {"views": 1}}
     )
+    viewer_sketches.record("forum", topic_id, current_user.id)
+    forum_activity.record(topic_id, "views")
+    response.headers["ETag"] = etag
     
     return ForumTopic(**convert_objectid(topic))
 
+# Forum reply endpoints
+def encode_reply_cursor(reply: dict) -> str:
+    return f"{reply['created_at'].isoformat()}|{reply['_id']}"
+
+def decode_reply_cursor(cursor: str):
+    try:
+        created_at, reply_id = cursor.split("|")
+        return datetime.fromisoformat(created_at), ObjectId(reply_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@app.post("/forum/{topic_id}/replies", response_model=ForumReply)
+async def create_forum_reply(
+    topic_id: str,
+    reply: ForumReplyCreate,
+    current_user: User = Depends(get_current_user)
+):
+    now = datetime.utcnow()
+    # Counter and last activity move in one atomic update on the topic
+    topic = await database.forum.find_one_and_update(
+        {"_id": ObjectId(topic_id)},
+        {"$inc": {"replies": 1}, "$max": {"last_activity_at": now}},
+        projection={"_id": 1},
+    )
+    if not topic:
+        raise HTTPException(status_code=404, detail="Topic not found")
+    
+    reply_dict = reply.dict()
+    reply_dict["topic_id"] = topic_id
+    reply_dict["author_id"] = current_user.id
+    reply_dict["author_name"] = current_user.full_name
+    reply_dict["author_avatar"] = current_user.avatar_url
+    reply_dict["created_at"] = now
+    
+    result = await database.forum_replies.insert_one(reply_dict)
+    forum_activity.record(topic_id, "replies")
+    activity.record("forum_reply", topic_id, current_user.id)
+    # replies is a counter: drop our cached copy without bumping the version
+    publish_invalidation("forum", topic_id, {"replies"})
+    
+    reply_dict["_id"] = result.inserted_id
+    return ForumReply(**convert_objectid(reply_dict))
+
+@app.get("/forum/{topic_id}/replies", response_model=ForumReplyPage)
+async def get_forum_replies(
+    topic_id: str,
+    before: Optional[str] = None,
+    limit: int = 20,
+    current_user: User = Depends(get_current_user)
+):
+    """Newest replies first; pass next_cursor as `before` for older pages.
+
+    Keyset pagination on the (topic_id, created_at, _id) index means every
+    page costs the same, however deep into a long thread it is.
+    """
+    limit = max(1, min(limit, 100))
+    query = {"topic_id": topic_id}
+    if before:
+        created_at, reply_id = decode_reply_cursor(before)
+        query["$or"] = [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "_id": {"$lt": reply_id}},
+        ]
+    
+    replies = []
+    cursor = database.forum_replies.find(query).sort([("created_at", -1), ("_id", -1)]).limit(limit + 1)
+    async for reply in cursor:
+        replies.append(reply)
+    
+    next_cursor = encode_reply_cursor(replies[limit - 1]) if len(replies) > limit else None
+    return ForumReplyPage(
+        replies=[ForumReply(**convert_objectid(reply)) for reply in replies[:limit]],
+        next_cursor=next_cursor
+    )
+
 # Statistics endpoint
 @app.get("/statistics", response_model=Statistics)
 async def get_statistics(current_user: User = Depends(get_current_user)):
-    total_courses = await database.courses.count_documents({})
-    total_assignments = await database.assignments.count_documents({})
-    total_students = await database.students.count_documents({})
-    total_exams = await database.exams.count_documents({})
-    total_webinars = await database.webinars.count_documents({})
-    total_library_documents = await database.library.count_documents({})
-    total_forum_topics = await database.forum.count_documents({})
-    completed_assignments = await database.assignments.count_documents({"status": "completed"})
+    # Same totals for every role, so all concurrent callers share one key
+    return await single_flight.do(("statistics",), load_statistics)
+
+async def load_statistics() -> Statistics:
+    total_courses = await read_database.courses.count_documents({})
+    total_assignments = await read_database.assignments.count_documents({})
+    total_students = await read_database.students.count_documents({})
+    total_exams = await read_database.exams.count_documents({})
+    total_webinars = await read_database.webinars.count_documents({})
+    total_library_documents = await read_database.library.count_documents({})
+    total_forum_topics = await read_database.forum.count_documents({})
+    completed_assignments = await read_database.assignments.count_documents({"status": "completed"})
     
     # Calculate average score (mock data for now)
     average_score = 8.5
@@ -714,9 +2988,683 @@ async def get_statistics(current_user: User = Depends(get_current_user)):
         average_score=average_score
     )
 
+# Analytics endpoint
+@app.get("/analytics/activity")
+async def get_activity_analytics(
+    type: str,
+    start: datetime = Query(..., alias="from"),
+    end: datetime = Query(..., alias="to"),
+    granularity: str = "day",
+    current_user: User = Depends(get_current_user)
+):
+    if granularity not in ROLLUP_GRANULARITIES:
+        raise HTTPException(status_code=400, detail="granularity must be 'hour' or 'day'")
+    step = ROLLUP_GRANULARITIES[granularity]
+    first = rollup_bucket(start, granularity)
+    end = to_naive_utc(end)
+    if end <= first or (end - first) / step > 2000:
+        raise HTTPException(status_code=400, detail="Range must cover between 1 and 2000 buckets")
+    
+    counts = {}
+    async for bucket in read_database.activity_rollups.find(
+        {"type": type, "granularity": granularity, "bucket": {"$gte": first, "$lt": end}},
+        {"bucket": 1, "count": 1}
+    ):
+        counts[bucket["bucket"]] = bucket["count"]
+    
+    points = []
+    bucket = first
+    while bucket < end:
+        points.append({"bucket": bucket, "count": counts.get(bucket, 0)})
+        bucket += step
+    return {"type": type, "granularity": granularity, "points": points}
+
+# Course analytics endpoint
+PROGRESS_BUCKETS = [0, 20, 40, 60, 80, 101]
+SCORE_BUCKETS = [0, 2, 4, 6, 8, 10.01]
+PERCENTILES = [10, 25, 50, 75, 90]
+
+course_analytics_cache = DocumentCache(500, COURSE_ANALYTICS_TTL_SECONDS)
+
+COURSE_ANALYTICS_FIELDS = ("course_id", "progress", "average_score", "full_name", "email")
+
+async def invalidate_student_course_analytics(student_id: str):
+    student = await database.students.find_one({"_id": ObjectId(student_id)}, {"course_id": 1})
+    if student:
+        for course_id in student_course_ids(student, await enrolled_course_ids(student_id)):
+            course_analytics_cache.invalidate("course_analytics", course_id)
+
+@subscribe_invalidation
+def invalidate_course_analytics(collection: str, doc_id: Optional[str], fields: Optional[set]):
+    if collection == "enrollments":
+        key = parse_enrollment_id(doc_id)
+        course_analytics_cache.invalidate("course_analytics", key[0] if key else None)
+        return
+    if collection != "students" or not touches(fields, *COURSE_ANALYTICS_FIELDS):
+        return
+    if doc_id is None:
+        course_analytics_cache.invalidate("course_analytics")
+        return
+    # The courses the student was indexed under, then the ones it is in now
+    for previous in leaderboard_courses.get(doc_id, ()):
+        course_analytics_cache.invalidate("course_analytics", previous)
+    run_in_background(invalidate_student_course_analytics(doc_id), "Course analytics invalidation")
+
+def histogram(buckets: List[dict], boundaries: list) -> List[dict]:
+    counts = {bucket["_id"]: bucket["count"] for bucket in buckets}
+    return [
+        {"from": low, "to": min(high, boundaries[-1]), "count": counts.get(low, 0)}
+        for low, high in zip(boundaries, boundaries[1:])
+    ]
+
+async def course_student_match(course_id: str) -> dict:
+    """Students of a course: enrolled through enrollments or via the legacy course_id."""
+    enrolled = [
+        ObjectId(enrollment["student_id"])
+        async for enrollment in database.enrollments.find({"course_id": course_id}, {"student_id": 1, "_id": 0})
+        if ObjectId.is_valid(enrollment["student_id"])
+    ]
+    return {"$or": [{"course_id": course_id}, {"_id": {"$in": enrolled}}]}
+
+async def course_percentiles(match: dict, counts: dict) -> dict:
+    """Percentiles by rank, interpolated like np.percentile's default.
+
+    Each facet sorts the course and keeps only the two values around one
+    rank, so no stage ever collects every student into a single document.
+    """
+    facets = {}
+    for field, count in counts.items():
+        for p in PERCENTILES:
+            if count:
+                facets[f"{field}_p{p}"] = [
+                    {"$match": {field: {"$type": "number"}}},
+                    {"$sort": {field: 1}},
+                    {"$skip": int((count - 1) * p / 100)},
+                    {"$limit": 2},
+                    {"$project": {"_id": 0, field: 1}}
+                ]
+    result = {}
+    if facets:
+        pipeline = [{"$match": match}, {"$facet": facets}]
+        result = (await database.students.aggregate(pipeline).to_list(1))[0]
+    
+    computed = {}
+    for field, count in counts.items():
+        computed[field] = {}
+        for p in PERCENTILES:
+            rows = result.get(f"{field}_p{p}")
+            if not rows:
+                computed[field][f"p{p}"] = None
+                continue
+            position = (count - 1) * p / 100
+            low = rows[0][field]
+            high = rows[1][field] if len(rows) > 1 else low
+            computed[field][f"p{p}"] = round(float(low + (high - low) * (position - int(position))), 2)
+    return computed
+
+@app.get("/courses/{course_id}/analytics")
+async def get_course_analytics(
+    course_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    if current_user.role not in ("teacher", "admin"):
+        raise HTTPException(status_code=403, detail="Only teachers can view course analytics")
+    cached = course_analytics_cache.get("course_analytics", course_id)
+    if cached is not None:
+        return cached
+    
+    # Every facet runs server-side over the course_id and _id indexes; the
+    # percentile ranks depend on the counts, so they follow in a second round trip
+    match = await course_student_match(course_id)
+    pipeline = [
+        {"$match": match},
+        {"$facet": {
+            "progress": [{"$bucket": {
+                "groupBy": "$progress", "boundaries": PROGRESS_BUCKETS,
+                "default": "other", "output": {"count": {"$sum": 1}}
+            }}],
+            "scores": [{"$bucket": {
+                "groupBy": "$average_score", "boundaries": SCORE_BUCKETS,
+                "default": "other", "output": {"count": {"$sum": 1}}
+            }}],
+            "summary": [{"$group": {
+                "_id": None,
+                "students": {"$sum": 1},
+                "average_progress": {"$avg": "$progress"},
+                "average_score": {"$avg": "$average_score"},
+                "progress_count": {"$sum": {"$cond": [{"$isNumber": "$progress"}, 1, 0]}},
+                "score_count": {"$sum": {"$cond": [{"$isNumber": "$average_score"}, 1, 0]}}
+            }}],
+            "at_risk": [
+                {"$match": {"$or": [
+                    {"progress": {"$lt": AT_RISK_PROGRESS}},
+                    {"average_score": {"$lt": AT_RISK_SCORE}}
+                ]}},
+                {"$sort": {"progress": 1}},
+                {"$limit": 50},
+                {"$project": {"full_name": 1, "email": 1, "progress": 1, "average_score": 1}}
+            ]
+        }}
+    ]
+    result = (await database.students.aggregate(pipeline).to_list(1))[0]
+    summary = result["summary"][0] if result["summary"] else {}
+    quantiles = await course_percentiles(match, {
+        "progress": summary.get("progress_count", 0),
+        "average_score": summary.get("score_count", 0)
+    })
+    
+    analytics = {
+        "course_id": course_id,
+        "students": summary.get("students", 0),
+        "average_progress": round(summary.get("average_progress") or 0, 2),
+        "average_score": round(summary.get("average_score") or 0, 2),
+        "progress_histogram": histogram(result["progress"], PROGRESS_BUCKETS),
+        "score_histogram": histogram(result["scores"], SCORE_BUCKETS),
+        "progress_percentiles": quantiles["progress"],
+        "score_percentiles": quantiles["average_score"],
+        "at_risk": [convert_objectid(student) for student in result["at_risk"]]
+    }
+    course_analytics_cache.set("course_analytics", course_id, analytics)
+    return analytics
+
+# Leaderboards
+LEADERBOARD_METRICS = ("average_score", "completed_assignments")
+LEADERBOARD_PROJECTION = {"course_id": 1, "full_name": 1, **{metric: 1 for metric in LEADERBOARD_METRICS}}
+
+class Leaderboard:
+    """Students of one course ordered by a metric; rank and top-N in O(log n)."""
+
+    def __init__(self):
+        self.ranking = SortedList()  # (-value, student_id)
+        self.entries = {}  # student_id -> ((-value, student_id), full_name)
+
+    def upsert(self, student_id: str, value: float, full_name: str):
+        self.remove(student_id)
+        key = (-value, student_id)
+        self.ranking.add(key)
+        self.entries[student_id] = (key, full_name)
+
+    def remove(self, student_id: str):
+        entry = self.entries.pop(student_id, None)
+        if entry is not None:
+            self.ranking.remove(entry[0])
+
+    def rank_of(self, key) -> int:
+        # Ties share a rank: count everyone strictly ahead
+        return self.ranking.bisect_left((key[0],)) + 1
+
+    def rank(self, student_id: str) -> Optional[int]:
+        entry = self.entries.get(student_id)
+        return self.rank_of(entry[0]) if entry else None
+
+    def row(self, key) -> dict:
+        student_id = key[1]
+        return {
+            "rank": self.rank_of(key),
+            "student_id": student_id,
+            "full_name": self.entries[student_id][1],
+            "value": -key[0]
+        }
+
+    def top(self, limit: int, offset: int = 0) -> List[dict]:
+        return [self.row(key) for key in self.ranking.islice(offset, offset + limit)]
+
+leaderboards = {}  # (course_id, metric) -> Leaderboard
+leaderboard_courses = {}  # student_id -> course_ids currently indexed
+leaderboard_reload_pending = False
+
+def index_student_for_leaderboards(student: dict, course_ids: set, boards: dict, courses: dict):
+    student_id = str(student["_id"])
+    for previous in courses.pop(student_id, set()) - course_ids:
+        for metric in LEADERBOARD_METRICS:
+            boards[(previous, metric)].remove(student_id)
+    if not course_ids:
+        return
+    courses[student_id] = set(course_ids)
+    for course_id in course_ids:
+        for metric in LEADERBOARD_METRICS:
+            board = boards.setdefault((course_id, metric), Leaderboard())
+            board.upsert(student_id, student.get(metric) or 0, student.get("full_name", ""))
+
+def student_course_ids(student: dict, enrolled: set) -> set:
+    """Courses a student ranks in: enrollments plus the legacy course_id."""
+    course_ids = set(enrolled)
+    if student.get("course_id"):
+        course_ids.add(student["course_id"])
+    return course_ids
+
+async def load_leaderboards():
+    global leaderboards, leaderboard_courses
+    enrolled = {}  # student_id -> course_ids
+    async for enrollment in database.enrollments.find({}, {"student_id": 1, "course_id": 1, "_id": 0}):
+        enrolled.setdefault(enrollment["student_id"], set()).add(enrollment["course_id"])
+    
+    # Build aside and swap, so readers never see a half-loaded board
+    boards, courses = {}, {}
+    async for student in database.students.find({}, LEADERBOARD_PROJECTION):
+        course_ids = student_course_ids(student, enrolled.get(str(student["_id"]), set()))
+        if course_ids:
+            index_student_for_leaderboards(student, course_ids, boards, courses)
+    leaderboards, leaderboard_courses = boards, courses
+
+async def reload_leaderboards_later():
+    global leaderboard_reload_pending
+    try:
+        await asyncio.sleep(LEADERBOARD_RELOAD_DEBOUNCE_SECONDS)
+    finally:
+        # Writes from here on need a fresh scan, so they schedule the next reload
+        leaderboard_reload_pending = False
+    await load_leaderboards()
+
+def request_leaderboard_reload():
+    global leaderboard_reload_pending
+    if not leaderboard_reload_pending:
+        leaderboard_reload_pending = True
+        run_in_background(reload_leaderboards_later(), "Leaderboard reload")
+
+async def enrolled_course_ids(student_id: str) -> set:
+    return {
+        enrollment["course_id"]
+        async for enrollment in database.enrollments.find({"student_id": student_id}, {"course_id": 1, "_id": 0})
+    }
+
+async def refresh_leaderboard_entry(student_id: str):
+    student = await database.students.find_one({"_id": ObjectId(student_id)}, LEADERBOARD_PROJECTION)
+    course_ids = set()
+    if student:
+        course_ids = student_course_ids(student, await enrolled_course_ids(student_id))
+    index_student_for_leaderboards(student or {"_id": student_id}, course_ids, leaderboards, leaderboard_courses)
+
+@subscribe_invalidation
+def invalidate_leaderboards(collection: str, doc_id: Optional[str], fields: Optional[set]):
+    if collection == "enrollments":
+        # Enrollment ids name the student; only id-less and legacy events need a full scan
+        key = parse_enrollment_id(doc_id)
+        if key is None:
+            request_leaderboard_reload()
+        else:
+            run_in_background(refresh_leaderboard_entry(key[1]), "Leaderboard refresh")
+    elif collection == "students" and touches(fields, *LEADERBOARD_PROJECTION):
+        if doc_id is None:
+            request_leaderboard_reload()
+        else:
+            run_in_background(refresh_leaderboard_entry(doc_id), "Leaderboard refresh")
+
+def get_leaderboard(course_id: str, metric: str) -> Leaderboard:
+    if metric not in LEADERBOARD_METRICS:
+        raise HTTPException(status_code=400, detail=f"metric must be one of {', '.join(LEADERBOARD_METRICS)}")
+    return leaderboards.get((course_id, metric)) or Leaderboard()
+
+@app.get("/courses/{course_id}/leaderboard")
+async def get_course_leaderboard(
+    course_id: str,
+    metric: str = "average_score",
+    skip: int = 0,
+    limit: int = 10,
+    current_user: User = Depends(get_current_user)
+):
+    board = get_leaderboard(course_id, metric)
+    return {
+        "metric": metric,
+        "total": len(board.ranking),
+        "entries": board.top(min(limit, 100), skip)
+    }
+
+@app.get("/courses/{course_id}/leaderboard/me")
+async def get_my_course_rank(
+    course_id: str,
+    metric: str = "average_score",
+    current_user: User = Depends(get_current_user)
+):
+    board = get_leaderboard(course_id, metric)
+    student = await find_student_for_user(current_user)
+    student_id = str(student["_id"])
+    if student_id not in board.entries:
+        raise HTTPException(status_code=404, detail="Student is not ranked in this course")
+    
+    key = board.entries[student_id][0]
+    return {"metric": metric, "total": len(board.ranking), **board.row(key)}
+
+# Course recommendations
+def build_recommendation_table(student_idx, course_idx, n_students, categories, levels, published, top_k, chunk):
+    """Item-item similarity and per-student top-k. Runs in a worker process.
+
+    The student x course matrix is only ever materialised chunk rows at a
+    time, so memory stays at chunk x courses regardless of cohort size.
+    """
+    n_courses = len(categories)
+    keys = np.unique(student_idx.astype(np.int64) * n_courses + course_idx)
+    student_idx, course_idx = keys // n_courses, keys % n_courses
+    bounds = np.searchsorted(student_idx, np.arange(0, n_students + chunk, chunk))
+
+    def chunk_matrix(i):
+        lo, hi = bounds[i], bounds[i + 1]
+        block = np.zeros((chunk, n_courses), dtype=np.float32)
+        block[student_idx[lo:hi] - i * chunk, course_idx[lo:hi]] = 1.0
+        return block
+
+    n_chunks = len(bounds) - 1
+    co = np.zeros((n_courses, n_courses), dtype=np.float32)
+    for i in range(n_chunks):
+        block = chunk_matrix(i)
+        co += block.T @ block
+    counts = np.diag(co).copy()
+    norms = np.sqrt(np.maximum(counts, 1.0))
+    collaborative = co / np.outer(norms, norms)
+
+    features = np.zeros((n_courses, 0), dtype=np.float32)
+    for column in (categories, levels):
+        _, inverse = np.unique(column, return_inverse=True)
+        features = np.hstack([features, np.eye(inverse.max() + 1, dtype=np.float32)[inverse]])
+    content = (features @ features.T) / 2.0
+
+    similarity = RECOMMENDATION_CF_WEIGHT * collaborative + (1 - RECOMMENDATION_CF_WEIGHT) * content
+    np.fill_diagonal(similarity, 0.0)
+    similarity[:, ~published] = 0.0
+
+    k = min(top_k, n_courses)
+    top_courses = np.full((n_students, k), -1, dtype=np.int32)
+    top_scores = np.zeros((n_students, k), dtype=np.float32)
+    for i in range(n_chunks):
+        block = chunk_matrix(i)
+        scores = block @ similarity
+        scores[block > 0] = 0.0
+        best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(scores, best, axis=1)
+        order = np.argsort(-best_scores, axis=1)
+        best = np.take_along_axis(best, order, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best[best_scores <= 0] = -1
+        rows = slice(i * chunk, min((i + 1) * chunk, n_students))
+        top_courses[rows] = best[:rows.stop - rows.start]
+        top_scores[rows] = best_scores[:rows.stop - rows.start]
+
+    popular = [int(c) for c in np.argsort(-counts, kind="stable") if published[c]][:top_k]
+    return top_courses, top_scores, popular
+
+class RecommendationTable:
+    """Precomputed top-k courses per student, swapped in whole after each rebuild."""
+
+    def __init__(self):
+        self.course_ids = []
+        self.student_rows = {}  # student_id -> row in top_courses
+        self.top_courses = np.zeros((0, 0), dtype=np.int32)
+        self.top_scores = np.zeros((0, 0), dtype=np.float32)
+        self.popular = []
+        self.built_at = None
+        self.stats = {"rebuilds": 0, "build_seconds": 0.0}
+
+    def recommend(self, student_id: str, exclude: set, limit: int):
+        row = self.student_rows.get(student_id)
+        picks = []
+        if row is not None:
+            for course, score in zip(self.top_courses[row], self.top_scores[row]):
+                if course >= 0 and self.course_ids[course] not in exclude:
+                    picks.append((self.course_ids[course], float(score)))
+        source = "personalized" if picks else "popular"
+        if not picks:
+            picks = [(self.course_ids[c], 0.0) for c in self.popular if self.course_ids[c] not in exclude]
+        return source, picks[:limit]
+
+    def metrics(self) -> dict:
+        return {
+            **self.stats,
+            "students": len(self.student_rows),
+            "courses": len(self.course_ids),
+            "built_at": self.built_at.isoformat() if self.built_at else None
+        }
+
+recommendations = RecommendationTable()
+recommendation_pool = None
+
+def new_recommendation_pool() -> ProcessPoolExecutor:
+    # spawn, not fork: forking would copy the event loop and Motor's sockets
+    return ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+
+async def rebuild_recommendations():
+    global recommendations
+    started = time.monotonic()
+    course_ids, categories, levels, open_courses = [], [], [], []
+    async for course in read_database.courses.find({}, {"category": 1, "level": 1, "status": 1}):
+        course_ids.append(str(course["_id"]))
+        categories.append(course.get("category") or "")
+        levels.append(course.get("level") or "")
+        open_courses.append(course.get("status") == "active")
+    if not course_ids:
+        return
+    course_index = {course_id: i for i, course_id in enumerate(course_ids)}
+    
+    student_rows = {}
+    pairs_student, pairs_course = [], []
+    def add_pair(student_id, course_id):
+        if course_id in course_index:
+            pairs_student.append(student_rows.setdefault(student_id, len(student_rows)))
+            pairs_course.append(course_index[course_id])
+    async for enrollment in read_database.enrollments.find({}, {"student_id": 1, "course_id": 1, "_id": 0}):
+        add_pair(enrollment["student_id"], enrollment["course_id"])
+    async for student in read_database.students.find({"course_id": {"$ne": None}}, {"course_id": 1}):
+        add_pair(str(student["_id"]), student["course_id"])
+    if not student_rows:
+        return
+    
+    loop = asyncio.get_running_loop()
+    top_courses, top_scores, popular = await loop.run_in_executor(
+        recommendation_pool, build_recommendation_table,
+        np.array(pairs_student, dtype=np.int32), np.array(pairs_course, dtype=np.int32), len(student_rows),
+        np.array(categories), np.array(levels), np.array(open_courses, dtype=bool),
+        RECOMMENDATION_TOP_K, RECOMMENDATION_CHUNK_STUDENTS
+    )
+    table = RecommendationTable()
+    table.course_ids, table.student_rows = course_ids, student_rows
+    table.top_courses, table.top_scores, table.popular = top_courses, top_scores, popular
+    table.built_at = datetime.utcnow()
+    table.stats = {
+        "rebuilds": recommendations.stats["rebuilds"] + 1,
+        "build_seconds": round(time.monotonic() - started, 3)
+    }
+    recommendations = table
+
+async def run_recommendation_builder():
+    global recommendation_pool
+    while True:
+        try:
+            await rebuild_recommendations()
+        except BrokenProcessPool:
+            logger.error("Recommendation worker died, starting a new one")
+            recommendation_pool = new_recommendation_pool()
+        except Exception:
+            logger.exception("Recommendation rebuild failed")
+        # Jitter so workers started together don't all rebuild at once
+        await asyncio.sleep(RECOMMENDATION_REBUILD_SECONDS * random.uniform(0.9, 1.1))
+
+async def recommend_for_student(student_id: str, limit: int):
+    enrolled = set()
+    async for enrollment in database.enrollments.find({"student_id": student_id}, {"course_id": 1, "_id": 0}):
+        enrolled.add(enrollment["course_id"])
+    source, picks = recommendations.recommend(student_id, enrolled, min(limit, RECOMMENDATION_TOP_K))
+    
+    results = []
+    for course_id, score in picks:
+        course = await find_one_cached("courses", course_id)
+        if course:
+            results.append({"course": Course(**convert_objectid(course)), "score": round(score, 4)})
+    return {
+        "student_id": student_id,
+        "source": source,
+        "generated_at": recommendations.built_at,
+        "recommendations": results
+    }
+
+@app.get("/recommendations")
+async def get_my_recommendations(
+    limit: int = 10,
+    current_user: User = Depends(get_current_user)
+):
+    student = await find_student_for_user(current_user)
+    return await recommend_for_student(str(student["_id"]), limit)
+
+@app.get("/students/{student_id}/recommendations")
+async def get_student_recommendations(
+    student_id: str,
+    limit: int = 10,
+    current_user: User = Depends(get_current_user)
+):
+    return await recommend_for_student(student_id, limit)
+
+# Calendar endpoint
+CALENDAR_SOURCES = [
+    # (collection, event type, date field)
+    ("assignments", "assignment", "due_date"),
+    ("exams", "exam", "exam_date"),
+    ("webinars", "webinar", "scheduled_date"),
+]
+
+async def fetch_calendar_events(collection: str, event_type: str, date_field: str, start: datetime, end: datetime, count: int):
+    events = []
+    cursor = read_database[collection].find(
+        {date_field: {"$gte": start, "$lt": end}},
+        {"title": 1, date_field: 1, "duration_minutes": 1, "course_id": 1, "status": 1}
+    ).sort(date_field, 1).limit(count)
+    async for doc in cursor:
+        events.append(CalendarEvent(
+            id=str(doc["_id"]),
+            type=event_type,
+            title=doc["title"],
+            date=doc[date_field],
+            duration_minutes=doc.get("duration_minutes"),
+            course_id=doc.get("course_id"),
+            status=doc.get("status")
+        ))
+    return events
+
+@app.get("/calendar", response_model=List[CalendarEvent])
+async def get_calendar(
+    start: datetime = Query(..., alias="from"),
+    end: datetime = Query(..., alias="to"),
+    skip: int = 0,
+    limit: int = 100,
+    current_user: User = Depends(get_current_user)
+):
+    start, end = to_naive_utc(start), to_naive_utc(end)
+    if end <= start:
+        raise HTTPException(status_code=400, detail="'to' must be after 'from'")
+    # limit(0) would mean "no limit" to Mongo and scan every source in full
+    skip = max(0, skip)
+    limit = max(1, min(limit, 500))
+    
+    # Each source is already sorted on its indexed date field, so the first
+    # skip + limit of every source is enough for the merged page.
+    streams = await asyncio.gather(*[
+        fetch_calendar_events(collection, event_type, date_field, start, end, skip + limit)
+        for collection, event_type, date_field in CALENDAR_SOURCES
+    ])
+    merged = heapq.merge(*streams, key=lambda event: event.date)
+    return list(islice(merged, skip, skip + limit))
+
+# Autocomplete endpoint
+@app.get("/autocomplete")
+async def autocomplete(
+    q: str,
+    type: str = "courses",
+    limit: int = 10,
+    current_user: User = Depends(get_current_user)
+):
+    if type not in autocomplete_indexes:
+        raise HTTPException(status_code=400, detail="Unknown autocomplete type")
+    # Same visibility as /search/global: students are staff-only, private
+    # library documents are only suggested to their author
+    staff = current_user.role in ("teacher", "admin")
+    if type == "students" and not staff:
+        raise HTTPException(status_code=403, detail="Only teachers can search students")
+    
+    viewer = None if staff else current_user.id
+    return {"suggestions": autocomplete_indexes[type].search(q, max(1, min(limit, 50)), viewer)}
+
+# Global search endpoint
+GLOBAL_SEARCH_SOURCES = [
+    # (collection, result type, title field, other text-indexed fields)
+    ("courses", "course", "title", ["description", "category"]),
+    ("assignments", "assignment", "title", ["description"]),
+    ("exams", "exam", "title", ["description"]),
+    ("webinars", "webinar", "title", ["description"]),
+    ("students", "student", "full_name", ["email"]),
+    ("library", "document", "title", ["description", "category"]),
+    ("forum", "topic", "title", ["content", "tags"]),
+]
+
+def global_search_filter(collection: str, current_user: User) -> Optional[dict]:
+    """Extra filter per collection for the caller, or None to skip it."""
+    staff = current_user.role in ("teacher", "admin")
+    if collection == "students":
+        return {} if staff else None
+    if collection == "library" and not staff:
+        return {"$or": [{"is_public": True}, {"author_id": current_user.id}]}
+    return {}
+
+async def search_collection(collection: str, result_type: str, title_field: str, q: str, extra: dict, cap: int):
+    cursor = database[collection].find(
+        {"$text": {"$search": q}, **extra},
+        {title_field: 1, "score": {"$meta": "textScore"}}
+    ).sort([("score", {"$meta": "textScore"})]).limit(cap)
+    cursor = cursor.max_time_ms(int(GLOBAL_SEARCH_TIMEOUT_SECONDS * 1000))
+    return [
+        {"type": result_type, "id": str(doc["_id"]), "title": doc.get(title_field, ""), "score": round(doc["score"], 3)}
+        async for doc in cursor
+    ]
+
+@app.get("/search/global")
+async def global_search(
+    q: str,
+    limit: int = 20,
+    current_user: User = Depends(get_current_user)
+):
+    q = q.strip()[:100]
+    if not q:
+        raise HTTPException(status_code=400, detail="Query must not be empty")
+    
+    tasks = {}
+    for collection, result_type, title_field, _ in GLOBAL_SEARCH_SOURCES:
+        extra = global_search_filter(collection, current_user)
+        if extra is not None:
+            tasks[collection] = asyncio.ensure_future(search_collection(
+                collection, result_type, title_field, q, extra, GLOBAL_SEARCH_PER_COLLECTION
+            ))
+    done, pending = await asyncio.wait(tasks.values(), timeout=GLOBAL_SEARCH_TIMEOUT_SECONDS)
+    for task in pending:
+        task.cancel()
+    
+    # Every source is already sorted by score, so a k-way merge is enough
+    sources, timed_out, failed = [], [], []
+    for collection, task in tasks.items():
+        if task in pending:
+            timed_out.append(collection)
+        elif isinstance(task.exception(), ExecutionTimeout):
+            timed_out.append(collection)
+        elif task.exception() is not None:
+            logger.warning("Global search on %s failed: %s", collection, task.exception())
+            failed.append(collection)
+        else:
+            sources.append(task.result())
+    results = list(islice(heapq.merge(*sources, key=lambda r: -r["score"]), max(1, min(limit, 50))))
+    
+    return {
+        "query": q,
+        "results": results,
+        "partial": bool(timed_out or failed),
+        "timed_out": timed_out,
+        "failed": failed
+    }
+
 # Notifications endpoint
 @app.get("/notifications")
 async def get_notifications(current_user: User = Depends(get_current_user)):
+    # Notifications emitted by the status scheduler
+    notifications = []
+    async for notification in database.notifications.find().sort("created_at", -1).limit(20):
+        notifications.append(convert_objectid(notification))
+    if notifications:
+        return {"notifications": notifications}
+    
     # Mock notifications data
     notifications = [
         {
@@ -751,7 +3699,11 @@ async def mark_notification_as_read(
     notification_id: str,
     current_user: User = Depends(get_current_user)
 ):
-    # In a real implementation, update the notification in the database
+    if ObjectId.is_valid(notification_id):
+        await database.notifications.update_one(
+            {"_id": ObjectId(notification_id)},
+            {"$set": {"is_read": True}}
+        )
     return {"message": "Notification marked as read"}
 
 # Initialize sample data
@@ -882,7 +3834,14 @@ async def init_sample_data():
         }
     ]
     
+    # Running sums behind completed_assignments/average_score
+    for student in sample_students:
+        student["score_sum"] = student["average_score"] * student["completed_assignments"]
+        student["graded_count"] = student["completed_assignments"]
+    
     await database.students.insert_many(sample_students)
+    for collection in ["users", "courses", "assignments", "students"]:
+        await record_write(collection)
     
     return {"message": "Sample data initialized successfully"}
 
@@ -902,6 +3861,30 @@ async def check_users():
         users.append(user_data)
     return {"users": users, "count": len(users)}
 
+# Metrics endpoint
+@app.get("/metrics")
+async def get_metrics():
+    return {
+        "document_cache": document_cache.metrics(),
+        "course_analytics_cache": course_analytics_cache.metrics(),
+        "compression": compression_metrics(),
+        "exam_answers": {
+            **answer_buffer.stats,
+            "pending_sessions": len(answer_buffer.pending),
+            "pending_answers": answer_buffer.pending_answers
+        },
+        "status_scheduler": status_scheduler.metrics(),
+        "forum_activity": {**forum_activity.stats, "pending_topics": len(forum_activity.pending)},
+        "viewer_sketches": {**viewer_sketches.stats, "pending_documents": len(viewer_sketches.pending)},
+        "activity": {**activity.stats, "pending_events": len(activity.events)},
+        "mongodb": database_metrics(),
+        "rate_limit": {"policies": rate_limit_stats, **rate_limit_backend.metrics()},
+        "admission": {name: limiter.metrics() for name, limiter in admission_limiters.items()},
+        "single_flight": single_flight.metrics(),
+        "recommendations": recommendations.metrics(),
+        "leaderboards": {"boards": len(leaderboards), "ranked_students": len(leaderboard_courses)},
+    }
+
 # Add health check endpoint
 @app.get("/health")
 async def health_check():
@@ -922,7 +3905,242 @@ async def health_check():
     except Exception as e:
         return {"status": "unhealthy", "database": "disconnected", "error": str(e)}
 
-# Run server
+# Status transition scheduler
+STATUS_TRANSITIONS = [
+    # (collection, date field, due after duration, from, to, notification title, message)
+    ("exams", "exam_date", False, "upcoming", "ongoing",
+     "Bài kiểm tra đã bắt đầu", "{title} đang diễn ra"),
+    ("exams", "exam_date", True, "ongoing", "completed",
+     "Bài kiểm tra đã kết thúc", "{title} đã kết thúc"),
+    ("webinars", "scheduled_date", False, "upcoming", "live",
+     "Webinar đang diễn ra", "Webinar {title} đã bắt đầu"),
+    ("webinars", "scheduled_date", True, "live", "completed",
+     "Webinar đã kết thúc", "Webinar {title} đã kết thúc"),
+    ("assignments", "due_date", False, "pending", "overdue",
+     "Bài tập quá hạn", "{title} đã quá hạn nộp"),
+]
+
+# collection -> fields a transition depends on
+SCHEDULED_FIELDS = {
+    rule[0]: {"status", "title", "duration_minutes", *(other[1] for other in STATUS_TRANSITIONS if other[0] == rule[0])}
+    for rule in STATUS_TRANSITIONS
+}
+
+class StatusScheduler:
+    """Advances exam/webinar/assignment statuses when their dates pass.
+
+    Upcoming transitions within SCHEDULER_HORIZON_SECONDS sit in a heap, so
+    the loop sleeps until the next one is due and then flips everything due
+    with one update_many per rule. Only the worker holding the Mongo lease
+    runs transitions; the others keep trying to take the lease over.
+    """
+
+    def __init__(self):
+        self.queue = []  # heap of (due_at, rule index, doc_id, title)
+        self.queued = set()
+        self.wakeup = None  # created in run() on the serving event loop
+        self.reload_needed = True
+        self.last_reload = 0.0
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+        self.lease_renewed = 0.0
+        self.stats = {"transitions": 0, "batches": 0, "reloads": 0}
+
+    def request_reload(self, collection: str, doc_id: Optional[str] = None, fields: Optional[set] = None):
+        if collection not in SCHEDULED_FIELDS:
+            return
+        # Counter updates such as registered_count can't move a transition
+        if not touches(fields, *SCHEDULED_FIELDS[collection]):
+            return
+        if not self.reload_needed:
+            self.reload_needed = True
+            if self.wakeup is not None:
+                self.wakeup.set()
+
+    async def renew_lease(self):
+        now = datetime.utcnow()
+        try:
+            lease = await database.scheduler_leases.find_one_and_update(
+                {"_id": "status_scheduler", "$or": [{"owner": self.owner}, {"expires_at": {"$lt": now}}]},
+                {"$set": {"owner": self.owner, "expires_at": now + timedelta(seconds=SCHEDULER_LEASE_SECONDS)}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+            leader = lease is not None
+        except DuplicateKeyError:
+            leader = False  # another worker holds a live lease
+        if leader and not self.is_leader:
+            self.reload_needed = True
+        self.is_leader = leader
+        self.lease_renewed = time.monotonic()
+
+    async def release_lease(self):
+        """Let another worker take over immediately on clean shutdown."""
+        if self.is_leader:
+            await database.scheduler_leases.delete_one({"_id": "status_scheduler", "owner": self.owner})
+            self.is_leader = False
+
+    async def reload(self):
+        horizon = datetime.utcnow() + timedelta(seconds=SCHEDULER_HORIZON_SECONDS)
+        self.queue, self.queued = [], set()
+        for rule_index, (collection, date_field, after_duration, from_status, *_) in enumerate(STATUS_TRANSITIONS):
+            # The date field bounds due_at from below, so this range covers every candidate
+            async for doc in database[collection].find(
+                {"status": from_status, date_field: {"$lt": horizon}},
+                {"title": 1, date_field: 1, "duration_minutes": 1}
+            ):
+                due_at = doc[date_field]
+                if after_duration:
+                    due_at += timedelta(minutes=doc.get("duration_minutes") or 0)
+                if due_at <= horizon:
+                    heapq.heappush(self.queue, (due_at, rule_index, str(doc["_id"]), doc.get("title", "")))
+                    self.queued.add((rule_index, str(doc["_id"])))
+        self.reload_needed = False
+        self.last_reload = time.monotonic()
+        self.stats["reloads"] += 1
+
+    async def apply_due(self):
+        now = datetime.utcnow()
+        due = {}
+        while self.queue and self.queue[0][0] <= now:
+            _, rule_index, doc_id, title = heapq.heappop(self.queue)
+            self.queued.discard((rule_index, doc_id))
+            due.setdefault(rule_index, {})[ObjectId(doc_id)] = title
+        for rule_index, docs in due.items():
+            collection, _, _, from_status, to_status, title, message = STATUS_TRANSITIONS[rule_index]
+            query = {"_id": {"$in": list(docs)}, "status": from_status}
+            changed = [doc["_id"] async for doc in database[collection].find(query, {"_id": 1})]
+            if not changed:
+                continue
+            await database[collection].update_many(query, {"$set": {"status": to_status}})
+            await database.notifications.insert_many([
+                {
+                    "title": title,
+                    "message": message.format(title=docs[doc_id]),
+                    "type": collection.rstrip("s"),
+                    "ref_id": str(doc_id),
+                    "is_read": False,
+                    "created_at": now
+                }
+                for doc_id in changed
+            ])
+            await record_write(collection)
+            self.stats["transitions"] += len(changed)
+            self.stats["batches"] += 1
+
+    async def run(self):
+        self.wakeup = asyncio.Event()
+        self.lease_renewed = 0.0
+        while True:
+            self.wakeup.clear()
+            try:
+                if time.monotonic() - self.lease_renewed > SCHEDULER_LEASE_SECONDS / 3:
+                    await self.renew_lease()
+                if self.is_leader:
+                    since_reload = time.monotonic() - self.last_reload
+                    # Bursts of edits collapse into one reload per debounce window
+                    if (self.reload_needed and since_reload >= SCHEDULER_RELOAD_DEBOUNCE_SECONDS) \
+                            or since_reload > SCHEDULER_HORIZON_SECONDS / 2:
+                        await self.reload()
+                    await self.apply_due()
+            except PyMongoError as e:
+                logger.warning("Status scheduler error: %s", e)
+            
+            timeout = SCHEDULER_LEASE_SECONDS / 3
+            if self.is_leader and self.queue:
+                until_due = (self.queue[0][0] - datetime.utcnow()).total_seconds()
+                timeout = max(0.0, min(timeout, until_due))
+            if self.is_leader and self.reload_needed:
+                until_reload = SCHEDULER_RELOAD_DEBOUNCE_SECONDS - (time.monotonic() - self.last_reload)
+                timeout = max(0.0, min(timeout, until_reload))
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def metrics(self):
+        return {**self.stats, "leader": self.is_leader, "queued": len(self.queue)}
+
+status_scheduler = StatusScheduler()
+subscribe_invalidation(status_scheduler.request_reload)
+
+# Indexes
+async def create_indexes():
+    await database.submissions.create_index([("assignment_id", 1), ("student_id", 1)], unique=True)
+    await database.submissions.create_index([("student_id", 1)])
+    await database.students.create_index([("email", 1)])
+    await database.students.create_index([("course_id", 1)])
+    await database.exam_sessions.create_index([("exam_id", 1), ("student_id", 1)], unique=True)
+    await database.exam_sessions.create_index([("status", 1), ("deadline", 1)])
+    await database.webinar_registrations.create_index([("webinar_id", 1), ("user_id", 1)], unique=True)
+    await database.webinar_registrations.create_index([("webinar_id", 1), ("status", 1), ("registered_at", 1)])
+    await database.enrollments.create_index([("course_id", 1), ("student_id", 1)], unique=True)
+    await database.enrollments.create_index([("student_id", 1), ("course_id", 1)])
+    await database.enrollments.create_index([("course_id", 1), ("enrolled_at", 1)])
+    await database.course_enrollment_counters.create_index([("course_id", 1)])
+    for collection, _, date_field in CALENDAR_SOURCES:
+        await database[collection].create_index([(date_field, 1)])
+        await database[collection].create_index([("status", 1), (date_field, 1)])
+    await database.notifications.create_index([("created_at", -1)])
+    await database.forum_replies.create_index([("topic_id", 1), ("created_at", -1), ("_id", -1)])
+    await database.forum.create_index([("is_pinned", -1), ("hot_score", -1)])
+    await database.forum.create_index([("category", 1), ("is_pinned", -1), ("hot_score", -1)])
+    await database.activity_events.create_index(
+        [("at", 1)], expireAfterSeconds=ACTIVITY_EVENT_RETENTION_DAYS * 86400
+    )
+    await database.activity_rollups.create_index([("type", 1), ("granularity", 1), ("bucket", 1)])
+    for collection, _, title_field, fields in GLOBAL_SEARCH_SOURCES:
+        # "none" skips English stemming and stop words, which mangle Vietnamese text
+        await database[collection].create_index(
+            [(field, "text") for field in [title_field, *fields]],
+            weights={title_field: 10}, default_language="none", name="global_search"
+        )
+
+# Startup and shutdown, run from lifespan()
+async def startup():
+    await create_indexes()
+    await backfill_score_rollups()
+    await backfill_hot_scores()
+    await load_autocomplete_indexes()
+    await load_leaderboards()
+    app.state.invalidation_task = asyncio.create_task(watch_invalidations())
+    app.state.answer_flush_task = asyncio.create_task(run_answer_flusher())
+    app.state.scheduler_task = asyncio.create_task(status_scheduler.run())
+    app.state.forum_activity_task = asyncio.create_task(run_forum_activity_flusher())
+    app.state.viewer_sketch_task = asyncio.create_task(run_viewer_sketch_flusher())
+    app.state.activity_task = asyncio.create_task(run_activity_flusher())
+    global recommendation_pool
+    recommendation_pool = new_recommendation_pool()
+    app.state.recommendation_task = asyncio.create_task(run_recommendation_builder())
+
+async def shutdown():
+    for task in (
+        app.state.invalidation_task, app.state.answer_flush_task, app.state.scheduler_task,
+        app.state.forum_activity_task, app.state.viewer_sketch_task, app.state.activity_task,
+        app.state.recommendation_task,
+    ):
+        task.cancel()
+    
+    # Exam answers first: they are the only buffer a student can't redo.
+    # Each step is isolated so one failure doesn't skip the rest.
+    steps = [
+        ("Answer flush", answer_buffer.flush),
+        ("Scheduler lease release", status_scheduler.release_lease),
+        ("Forum activity flush", forum_activity.flush),
+        ("Viewer sketch flush", viewer_sketches.flush),
+        ("Activity flush", activity.flush),
+    ]
+    for description, step in steps:
+        try:
+            await step()
+        except Exception:
+            logger.exception("%s failed during shutdown", description)
+    try:
+        recommendation_pool.shutdown(wait=False, cancel_futures=True)
+    except Exception:
+        logger.exception("Recommendation pool shutdown failed")
+
+# Run a single development server; use server.py for multi-worker production
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
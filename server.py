@@ -0,0 +1,101 @@
+"""
+Production Server for EduTeach API
+Runs several uvicorn workers on one shared socket, replaces each worker after
+a bounded number of requests and drains them gracefully on SIGTERM
+"""
+
+import os
+import sys
+import time
+import random
+import signal
+import threading
+import multiprocessing
+import uvicorn
+
+# Configuration
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8000"))
+WORKERS = int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1)))
+MAX_REQUESTS = int(os.getenv("MAX_REQUESTS", "10000"))  # 0 disables recycling
+MAX_REQUESTS_JITTER = int(os.getenv("MAX_REQUESTS_JITTER", "1000"))
+GRACEFUL_TIMEOUT_SECONDS = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+FORWARDED_ALLOW_IPS = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1")
+RESPAWN_BACKOFF_SECONDS = 1.0
+
+multiprocessing.allow_connection_pickling()
+spawn = multiprocessing.get_context("spawn")
+
+def worker_config():
+    """Uvicorn settings for one worker; the request limit is jittered per worker
+    so they don't all restart at the same moment."""
+    limit = MAX_REQUESTS + random.randint(0, MAX_REQUESTS_JITTER) if MAX_REQUESTS else None
+    return uvicorn.Config(
+        "main:app",
+        host=HOST,
+        port=PORT,
+        lifespan="on",
+        proxy_headers=True,
+        forwarded_allow_ips=FORWARDED_ALLOW_IPS,
+        limit_max_requests=limit,
+        timeout_graceful_shutdown=GRACEFUL_TIMEOUT_SECONDS
+    )
+
+def run_worker(sock):
+    # Uvicorn handles SIGTERM in the worker: stop accepting, finish in-flight
+    # requests, then run the app lifespan shutdown (flushes buffered counters)
+    config = worker_config()
+    config.configure_logging()
+    uvicorn.Server(config).run(sockets=[sock])
+
+class Supervisor:
+    """Keeps WORKERS processes alive until SIGTERM/SIGINT, then drains them."""
+
+    def __init__(self):
+        self.socket = worker_config().bind_socket()
+        self.workers = []  # (process, started_at)
+        self.should_exit = threading.Event()
+
+    def spawn_worker(self):
+        process = spawn.Process(target=run_worker, args=(self.socket,))
+        process.start()
+        return process, time.monotonic()
+
+    def handle_signal(self, sig, frame):
+        self.should_exit.set()
+
+    def run(self):
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, self.handle_signal)
+
+        print(f"🚀 Starting {WORKERS} workers on {HOST}:{PORT} (parent pid {os.getpid()})")
+        self.workers = [self.spawn_worker() for _ in range(WORKERS)]
+        while not self.should_exit.wait(0.5):
+            for i, (process, started_at) in enumerate(self.workers):
+                if process.is_alive():
+                    continue
+                reason = "recycled" if process.exitcode == 0 else f"exit code {process.exitcode}"
+                print(f"♻️  Worker {process.pid} stopped ({reason}), starting a replacement")
+                # Don't spin if workers die on startup, e.g. MongoDB unreachable
+                if time.monotonic() - started_at < 5 and self.should_exit.wait(RESPAWN_BACKOFF_SECONDS):
+                    break
+                self.workers[i] = self.spawn_worker()
+        self.shutdown()
+
+    def shutdown(self):
+        print("🛑 Draining workers...")
+        for process, _ in self.workers:
+            if process.is_alive():
+                process.terminate()
+        for process, _ in self.workers:
+            process.join(GRACEFUL_TIMEOUT_SECONDS + 10)
+            if process.is_alive():
+                print(f"⚠️  Worker {process.pid} did not stop in time, killing it")
+                process.kill()
+                process.join()
+        self.socket.close()
+        print("✅ All workers stopped")
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    Supervisor().run()